@@ -1,16 +1,28 @@
 from functools import lru_cache
+import gc
 from os.path import join, normpath
 
+from sphinx.config import ENUM
 from sphinx.errors import SphinxError
+from sphinx.util import logging
 
+from .analyzer_utils import IrCache, snapshotted, sphinx_js_version
 from .directives import (auto_class_directive_bound_to_app,
                          auto_function_directive_bound_to_app,
                          auto_attribute_directive_bound_to_app,
-                         JSStaticFunction)
+                         JSStaticFunction,
+                         merge_fingerprints,
+                         outdated_documents,
+                         purge_fingerprints)
 from .jsdoc import Analyzer as JsAnalyzer
+from .render_cache import (forget_new_cache_entries, load_render_caches,
+                           merge_render_caches, save_render_caches)
 from .typedoc import Analyzer as TsAnalyzer
 
 
+logger = logging.getLogger(__name__)
+
+
 # Cache this to guarantee it only runs once.
 @lru_cache(maxsize=None)
 def fix_js_make_xref():
@@ -112,6 +124,14 @@ def setup(app):
     # app.add_source_parser(), but I think the kind of source it's referring to
     # is RSTs.
     app.connect('builder-inited', analyze)
+    app.connect('builder-inited', load_render_caches)
+    app.connect('env-merge-info', merge_render_caches)
+    app.connect('env-updated', forget_new_cache_entries)
+    app.connect('env-updated', unfreeze_analyzer)
+    app.connect('env-get-outdated', outdated_documents)
+    app.connect('env-purge-doc', purge_fingerprints)
+    app.connect('env-merge-info', merge_fingerprints)
+    app.connect('build-finished', save_render_caches)
 
     app.add_directive_to_domain('js',
                                 'staticfunction',
@@ -130,6 +150,23 @@ def setup(app):
     app.add_config_value('js_language', default='javascript', rebuild='env')
     app.add_config_value('js_source_path', default=['../'], rebuild='env', types=[str, list])
     app.add_config_value('jsdoc_config_path', default=None, rebuild='env')
+    app.add_config_value('jsdoc_cache', default=None, rebuild='env')
+    app.add_config_value('jsdoc_incremental', default=False, rebuild='env')
+    app.add_config_value('jsdoc_parallel_jobs', default=1, rebuild='', types=[int, str])
+    app.add_config_value('js_ir_cache_size', default=4096, rebuild='')
+    app.add_config_value('js_ir_cache_weak', default=False, rebuild='')
+    app.add_config_value('typedoc_cache', default=None, rebuild='env')
+    app.add_config_value('typedoc_lazy', default=False, rebuild='')
+    app.add_config_value('typedoc_parallel_jobs', default=1, rebuild='', types=[int, str])
+    app.add_config_value('js_sidecar', default=False, rebuild='')
+    app.add_config_value('js_object_dependencies', default=False, rebuild='env')
+    app.add_config_value('js_template_path', default=None, rebuild='env')
+    app.add_config_value('js_renderer', default='templates', rebuild='env',
+                         types=ENUM('templates', 'nodes'))
+    app.add_config_value('js_analysis_cache', default=None, rebuild='env')
+    app.add_config_value('js_render_cache_size', default=16 * 1024 * 1024, rebuild='')
+    app.add_config_value('js_node_cache_size', default=16 * 1024 * 1024, rebuild='')
+    app.add_config_value('js_suffix_index', default=False, rebuild='', types=[bool, int])
 
     # We could use a callable as the "default" param here, but then we would
     # have had to duplicate or build framework around the logic that promotes
@@ -137,6 +174,13 @@ def setup(app):
     # until we need to access js_source_path from more than one place.
     app.add_config_value('root_for_relative_js_paths', None, 'env')
 
+    # Directives only read the analyzer, and dependencies noted while reading
+    # are merged back from parallel readers by Sphinx's own collector, or, for
+    # object fingerprints, by merge_fingerprints().
+    return {'version': sphinx_js_version(),
+            'parallel_read_safe': True,
+            'parallel_write_safe': True}
+
 
 def analyze(app):
     """Run JSDoc or another analysis tool across a whole codebase, and squirrel
@@ -155,10 +199,45 @@ def analyze(app):
     except KeyError:
         raise SphinxError('Unsupported value of js_language in config: %s' % app.config.js_language)
 
-    # Analyze source code:
-    app._sphinxjs_analyzer = analyzer.from_disk(abs_source_paths,
-                                                app,
-                                                root_for_relative_paths)
+    # Analyze source code, or restore a snapshot of the last analysis:
+    def build():
+        return analyzer.from_disk(abs_source_paths, app, root_for_relative_paths)
+    if app.config.js_analysis_cache:
+        app._sphinxjs_analyzer = snapshotted(
+            app.config.js_analysis_cache,
+            analyzer.cache_inputs(abs_source_paths, app, root_for_relative_paths),
+            build,
+            lambda old, stale, manifest: old.update_from_disk(stale, manifest, app))
+    else:
+        app._sphinxjs_analyzer = build()
+
+    app._sphinxjs_analyzer.ir_cache = IrCache(app.config.js_ir_cache_size,
+                                              weak=app.config.js_ir_cache_weak)
+
+    # Index path suffixes, if asked, so directives resolve in one probe:
+    index_setting = app.config.js_suffix_index
+    if index_setting is not False:
+        count, size = app._sphinxjs_analyzer.index_suffixes(
+            None if index_setting is True else index_setting)
+        logger.info('sphinx-js: indexed %s path suffixes in about %.1f MB'
+                    % (count, size / 1e6))
+
+    if app.parallel > 1:
+        # Readers are forked and share the analyzer copy-on-write. Exempt it
+        # from cyclic garbage collection, which would otherwise write to the
+        # header of every object in it in each reader, copying all its pages.
+        gc.collect()
+        gc.freeze()
+        app._sphinxjs_gc_frozen = True
+
+
+def unfreeze_analyzer(app, env):
+    """Once the readers are done, return what ``analyze()`` froze to the
+    care of the garbage collector, so it doesn't stay exempt for the rest of
+    the process."""
+    if getattr(app, '_sphinxjs_gc_frozen', False):
+        gc.unfreeze()
+        app._sphinxjs_gc_frozen = False
 
 
 def root_or_fallback(root_for_relative_paths, abs_source_paths):
@@ -1,8 +1,26 @@
 """Conveniences shared among analyzers"""
 
-from functools import wraps
-from json import dump, load
+from collections import OrderedDict
+from functools import lru_cache, wraps
+import gc
+from hashlib import sha256
+from json import dump, dumps, JSONDecodeError, JSONDecoder, load
 import os
+from os.path import dirname, isfile, join, realpath
+import pickle
+from shutil import which
+import subprocess
+from sys import version_info
+from time import time_ns
+from weakref import WeakValueDictionary
+
+
+#: Bump this when the layout of cache files changes so old ones are ignored
+#: rather than misread.
+CACHE_FORMAT = 1
+
+#: Likewise for analysis snapshots
+SNAPSHOT_FORMAT = 1
 
 
 def program_name_on_this_platform(program):
@@ -11,6 +29,14 @@ def program_name_on_this_platform(program):
     return program + '.cmd' if os.name == 'nt' else program
 
 
+def parallel_jobs(setting):
+    """Return the number of processes to use, given a config value that is
+    either a positive integer or "auto" for one per CPU."""
+    if setting == 'auto':
+        return os.cpu_count() or 1
+    return max(int(setting), 1)
+
+
 class Command(object):
     def __init__(self, program):
         self.program = program_name_on_this_platform(program)
@@ -23,29 +49,351 @@ class Command(object):
         return [self.program] + self.args
 
 
-def cache_to_file(get_filename):
-    """Return a decorator that will cache the result of ``get_filename()`` to a
-    file
+def cache_to_file(get_filename, get_inputs):
+    """Return a decorator that will cache the result of the decorated function
+    to a file and reuse it until any of its inputs change
+
+    The cache is keyed on a manifest of the source files the function reads
+    and on a fingerprint of everything else that can affect its output, so it
+    flushes itself when sources, tool configuration, or versions change. Each
+    file's content hash is recomputed only if its mtime or size has changed
+    since the last run.
 
     :arg get_filename: A function which receives the original arguments of the
-        decorated function
+        decorated function and returns the path of the cache file, or None to
+        disable caching
+    :arg get_inputs: A function which receives the original arguments of the
+        decorated function and returns a tuple ``(source files, settings)``:
+        the absolute paths of the files the function will read and a JSON-able
+        representation of all its other inputs
+
     """
     def decorator(fn):
         @wraps(fn)
         def decorated(*args, **kwargs):
             filename = get_filename(*args, **kwargs)
-            if filename and os.path.isfile(filename):
-                with open(filename, encoding='utf-8') as f:
-                    return load(f)
+            if not filename:
+                return fn(*args, **kwargs)
+            source_files, settings = get_inputs(*args, **kwargs)
+            cached = load_cache(filename)
+            settings = fingerprint(settings)
+            manifest = source_manifest(source_files,
+                                       previous=cached and cached['manifest'])
+            if (cached and cached['settings'] == settings and
+                    manifests_match(cached['manifest'], manifest)):
+                return cached['output']
             res = fn(*args, **kwargs)
-            if filename:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    dump(res, f, indent=2)
+            save_cache(filename, settings, manifest, res)
             return res
         return decorated
     return decorator
 
 
+def load_cache(filename):
+    """Return the record stored in a cache file by :func:`save_cache`, or None
+    if there is no usable one."""
+    try:
+        with open(filename, encoding='utf-8') as f:
+            record = load(f)
+    except (OSError, ValueError):
+        return None
+    # Caches written by old versions of sphinx-js are bare JSON output.
+    if isinstance(record, dict) and record.get('format') == CACHE_FORMAT:
+        return record
+    return None
+
+
+def save_cache(filename, settings, manifest, output):
+    """Write a cache record atomically, so an interrupted build can't leave a
+    truncated cache behind.
+
+    :arg settings: The fingerprint of the non-file inputs
+    :arg manifest: The manifest of source files, as from
+        :func:`source_manifest`
+    :arg output: The JSON-able output to cache
+
+    """
+    temp = filename + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        dump(dict(format=CACHE_FORMAT,
+                  settings=settings,
+                  manifest=manifest,
+                  output=output),
+             f,
+             separators=(',', ':'))
+    os.replace(temp, filename)
+
+
+def snapshotted(filename, inputs, build, update=None):
+    """Return an analyzer restored from a snapshot file, or build one and
+    snapshot it for next time.
+
+    The snapshot is reused until any of the inputs of the analysis change,
+    which are the same things the tool-output caches are keyed on. Restoring
+    one skips not only running the tool but also indexing its output.
+
+    :arg filename: The path of the snapshot file
+    :arg inputs: A tuple ``(source files, settings)``, as returned by the
+        ``get_inputs`` function of :func:`cache_to_file`
+    :arg build: A function which returns a freshly made analyzer
+    :arg update: Optionally, a function which takes an analyzer restored from
+        a snapshot whose source files have since changed, the set of paths
+        that were added, changed, or removed, and the current manifest of
+        source files, and returns an up-to-date analyzer, or None if it can't
+
+    """
+    source_files, settings = inputs
+    # Pickles can refer to things that differ among Python versions:
+    settings = fingerprint([list(version_info[:2]), settings])
+    header = load_snapshot(filename)
+    manifest = source_manifest(source_files,
+                               previous=header and header['manifest'])
+    analyzer = None
+    if header and header['settings'] == settings:
+        if manifests_match(header['manifest'], manifest):
+            analyzer = load_snapshot(filename, with_analyzer=True)
+            if analyzer is not None:
+                return analyzer
+        elif update:
+            analyzer = load_snapshot(filename, with_analyzer=True)
+            if analyzer is not None:
+                analyzer = update(analyzer,
+                                  stale_files(header['manifest'], manifest),
+                                  manifest)
+    if analyzer is None:
+        analyzer = build()
+    save_snapshot(filename, settings, manifest, analyzer)
+    return analyzer
+
+
+def load_snapshot(filename, with_analyzer=False):
+    """Return the header of a snapshot file written by :func:`save_snapshot`
+    or, if ``with_analyzer``, the analyzer stored in it. Return None if there
+    is no usable snapshot.
+
+    The header is a separate pickle at the front of the file, so we can check
+    whether the snapshot is current without unpickling the whole analyzer.
+
+    """
+    try:
+        with open(filename, 'rb') as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+                return None
+            if not with_analyzer:
+                return header
+            # Unpickling allocates millions of objects, none of which are
+            # garbage. Don't let the collector keep combing through them.
+            was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                return pickle.load(f)
+            finally:
+                if was_enabled:
+                    gc.enable()
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError, IndexError, TypeError, ValueError):
+        # It's missing, truncated, or refers to code that has since changed.
+        return None
+
+
+def save_snapshot(filename, settings, manifest, analyzer):
+    """Pickle an analyzer to a snapshot file atomically, after a header
+    describing what it was made from.
+
+    :arg settings: The fingerprint of the non-file inputs
+    :arg manifest: The manifest of source files, as from
+        :func:`source_manifest`
+
+    """
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        pickle.dump(dict(format=SNAPSHOT_FORMAT,
+                         settings=settings,
+                         manifest=manifest),
+                    f,
+                    pickle.HIGHEST_PROTOCOL)
+        pickle.dump(analyzer, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, filename)
+
+
+def fingerprint(settings):
+    """Return a stable hash of a JSON-able object, mixed with the version of
+    sphinx-js itself."""
+    return sha256(dumps([CACHE_FORMAT, sphinx_js_version(), settings],
+                        sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(filename):
+    """Return the hex SHA-256 of a file's contents, or None if it doesn't
+    exist."""
+    digest = sha256()
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def source_manifest(filenames, previous=None):
+    """Return a mapping of absolute source-file paths to ``[mtime_ns, size,
+    content hash]``.
+
+    :arg filenames: Absolute paths of the files to describe. Ones that don't
+        exist are left out.
+    :arg previous: A manifest from an earlier run. Files whose mtime and size
+        haven't changed since then aren't rehashed.
+
+    """
+    previous = previous or {}
+    manifest = {}
+    # A file modified within the filesystem's timestamp granularity of now
+    # could change again without its mtime budging. Don't vouch for those.
+    racy_after = time_ns() - 2 * 10 ** 9
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            continue
+        old = previous.get(filename)
+        if old and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+            digest = old[2]
+        else:
+            digest = file_digest(filename)
+        mtime = stat.st_mtime_ns if stat.st_mtime_ns < racy_after else None
+        manifest[filename] = [mtime, stat.st_size, digest]
+    return manifest
+
+
+def manifests_match(a, b):
+    """Return whether 2 manifests describe the same set of file contents."""
+    return (a.keys() == b.keys() and
+            all(a[filename][2] == b[filename][2] for filename in a))
+
+
+def stale_files(old_manifest, new_manifest):
+    """Return the set of files added, removed, or changed between 2
+    manifests."""
+    return ({filename for filename, (_, _, digest) in new_manifest.items()
+             if filename not in old_manifest or old_manifest[filename][2] != digest} |
+            (old_manifest.keys() - new_manifest.keys()))
+
+
+@lru_cache(maxsize=None)
+def sphinx_js_version():
+    """Return the installed version of sphinx-js."""
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version('sphinx-js')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+@lru_cache(maxsize=None)
+def tool_version(program):
+    """Return the version of an npm-installed command-line tool, or None if it
+    can't be determined.
+
+    Look for the package.json next to the script npm links onto the path, so
+    we usually don't have to pay for starting node just to ask.
+
+    """
+    executable = which(program_name_on_this_platform(program))
+    if executable:
+        directory = dirname(realpath(executable))
+        while True:
+            manifest = join(directory, 'package.json')
+            if isfile(manifest):
+                try:
+                    with open(manifest, encoding='utf-8') as f:
+                        package = load(f)
+                except (OSError, ValueError):
+                    package = {}
+                if package.get('name') == program:
+                    return package.get('version')
+            parent = dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+    try:
+        return subprocess.run([program_name_on_this_platform(program), '--version'],
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the items of a JSON array read incrementally from a text stream.
+
+    Only one item (plus a chunk of unparsed text) is held in memory at a time,
+    so a consumer that discards most items can read enormous arrays in little
+    space.
+
+    :arg stream: A file-like object whose ``read(size)`` returns str
+    :arg chunk_size: How many characters to read at a time
+
+    If the stream doesn't hold a single, valid JSON array, raise ValueError.
+
+    """
+    decoder = JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def next_char():
+        """Skip whitespace, reading more as necessary, and return the next
+        character, or '' at the end of the stream."""
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            buffer, pos = stream.read(chunk_size), 0
+            eof = not buffer
+
+    if next_char() != '[':
+        raise ValueError('Expected a JSON array.')
+    pos += 1
+    if next_char() == ']':
+        pos += 1
+    else:
+        while True:
+            next_char()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except JSONDecodeError:
+                    item = end = None
+                # An item that runs to the end of the buffer (like a number)
+                # might not be complete yet, and one that doesn't parse may
+                # just be truncated. Read more and try again, reading more
+                # each time so huge items don't take quadratic time.
+                if (end is None or end == len(buffer)) and not eof:
+                    more = stream.read(max(chunk_size, len(buffer) - pos))
+                    eof = not more
+                    buffer = buffer[pos:] + more
+                    pos = 0
+                    continue
+                if end is None:
+                    raise ValueError('Invalid JSON in array.')
+                break
+            pos = end
+            yield item
+            separator = next_char()
+            pos += 1
+            if separator == ']':
+                break
+            elif separator != ',':
+                raise ValueError('Expected "," or "]" in JSON array.')
+    if next_char():
+        raise ValueError('Extra data after JSON array.')
+
+
 def is_explicitly_rooted(path):
     """Return whether a relative path is explicitly rooted relative to the
     cwd, rather than starting off immediately with a file or folder name.
@@ -70,3 +418,66 @@ def dotted_path(segments):
                                    if s not in ['./', '../']]
     segments_without_separators.append(segments[-1])
     return '.'.join(segments_without_separators)
+
+
+class IrCache:
+    """A bounded, least-recently-used memo of the IR objects an analyzer has
+    converted, keyed by full path and requested type
+
+    Past ``maxsize`` entries, the least recently used are dropped or, if
+    ``weak``, kept only as long as something else, like a class's list of
+    members, still refers to them. A ``maxsize`` of 0 with ``weak`` off turns
+    memoization off. ``hits`` and ``misses`` count lookups.
+
+    The memo isn't pickled with its analyzer, only its settings.
+
+    """
+    def __init__(self, maxsize=4096, weak=False):
+        self.maxsize = maxsize
+        self.weak = weak
+        self.clear()
+
+    def get(self, key, make):
+        """Return the IR object stored under a key, or call ``make()`` to
+        make and store it."""
+        obj = self._entries.get(key)
+        if obj is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return obj
+        if self.weak:
+            obj = self._weak_entries.get(key)
+            if obj is not None:
+                self.hits += 1
+                self._store(key, obj)
+                return obj
+        self.misses += 1
+        obj = make()
+        self._store(key, obj)
+        return obj
+
+    def clear(self):
+        """Forget everything, as when the analyzer's output changes."""
+        self._entries = OrderedDict()
+        self._weak_entries = WeakValueDictionary()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, obj):
+        if not self.maxsize:
+            if self.weak:
+                self._weak_entries[key] = obj
+            return
+        self._entries[key] = obj
+        if len(self._entries) > self.maxsize:
+            old_key, old_obj = self._entries.popitem(last=False)
+            if self.weak:
+                self._weak_entries[old_key] = old_obj
+
+    def __getstate__(self):
+        return {'maxsize': self.maxsize, 'weak': self.weak}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -7,16 +7,20 @@ JSDoc output, via closure. The renderer classes, able to be top-level classes,
 can access each other and collaborate.
 
 """
+from dataclasses import is_dataclass
 from os.path import join, relpath
 
 from docutils.parsers.rst import Directive
 from docutils.parsers.rst.directives import flag
 from sphinx import addnodes
 from sphinx.domains.javascript import JSCallable
+from sphinx.errors import SphinxError
 
+from .render_cache import render_key
 from .renderers import (AutoFunctionRenderer,
                         AutoClassRenderer,
                         AutoAttributeRenderer)
+from .suffix_tree import SuffixAmbiguous, SuffixNotFound
 
 
 class JsDirective(Directive):
@@ -32,12 +36,27 @@ class JsDirective(Directive):
     }
 
 
-def note_dependencies(app, dependencies):
+def note_dependencies(app, renderer):
     """Note dependencies of current document.
 
+    Those are the files the IR object rendered is from and any overridden
+    templates. With ``js_object_dependencies``, they are instead the templates
+    and a fingerprint of the object itself, which ``outdated_documents()``
+    checks on later builds.
+
     :arg app: Sphinx application object
-    :arg dependencies: iterable of filename strings relative to root_for_relative_paths
+    :arg renderer: The renderer of the directive being run
     """
+    if app.config.js_object_dependencies:
+        dependencies = renderer.template_dependencies()
+        key = renderer.object_key()
+        fingerprints = getattr(app.env, 'sphinxjs_fingerprints', None)
+        if fingerprints is None:
+            fingerprints = app.env.sphinxjs_fingerprints = {}
+        fingerprints.setdefault(app.env.docname, {})[key] = object_fingerprint(
+            app._sphinxjs_analyzer, *key)
+    else:
+        dependencies = renderer.dependencies()
     for fn in dependencies:
         # Dependencies in the IR are relative to `root_for_relative_paths`, itself
         # relative to the configuration directory.
@@ -47,6 +66,72 @@ def note_dependencies(app, dependencies):
         app.env.note_dependency(rel)
 
 
+def object_fingerprint(analyzer, partial_path, renderer_type):
+    """Return a fingerprint of the IR object a directive would render, or
+    None if there's no such object."""
+    try:
+        obj = analyzer.get_object(list(partial_path), renderer_type)
+    except (SuffixNotFound, SuffixAmbiguous, SphinxError):
+        return None
+    return render_key(_without_lines(obj))
+
+
+def _without_lines(value):
+    """Return a repr-able copy of an IR object with its line numbers, and
+    those of the objects within it, left out.
+
+    They say only where messages about the object point, so a page needn't
+    be rebuilt when, say, a comment above the object grows a line.
+
+    """
+    if is_dataclass(value):
+        return (type(value).__name__,
+                # vars(), unlike fields(), includes Param.default.
+                [(name, _without_lines(v)) for name, v in sorted(vars(value).items())
+                 if name != 'line'])
+    if isinstance(value, list):
+        return [_without_lines(v) for v in value]
+    return value
+
+
+def outdated_documents(app, env, added, changed, removed):
+    """Return the documents which rendered an IR object that has since
+    changed, by its fingerprint."""
+    fingerprints = getattr(env, 'sphinxjs_fingerprints', {})
+    current = {}
+    outdated = []
+    for docname, recorded in fingerprints.items():
+        if docname in changed or docname in removed:
+            continue
+        for key, fingerprint in recorded.items():
+            if key not in current:
+                current[key] = object_fingerprint(app._sphinxjs_analyzer, *key)
+            if current[key] != fingerprint:
+                outdated.append(docname)
+                break
+    return outdated
+
+
+def purge_fingerprints(app, env, docname):
+    """Forget the fingerprints noted by a document that's being reread or
+    was removed."""
+    getattr(env, 'sphinxjs_fingerprints', {}).pop(docname, None)
+
+
+def merge_fingerprints(app, env, docnames, other):
+    """Add the fingerprints noted by a parallel reader to the main
+    environment."""
+    theirs = getattr(other, 'sphinxjs_fingerprints', {})
+    if not theirs:
+        return
+    ours = getattr(env, 'sphinxjs_fingerprints', None)
+    if ours is None:
+        ours = env.sphinxjs_fingerprints = {}
+    for docname in docnames:
+        if docname in theirs:
+            ours[docname] = theirs[docname]
+
+
 def auto_function_directive_bound_to_app(app):
     class AutoFunctionDirective(JsDirective):
         """js:autofunction directive, which spits out a js:function directive
@@ -57,7 +142,7 @@ def auto_function_directive_bound_to_app(app):
         """
         def run(self):
             renderer = AutoFunctionRenderer.from_directive(self, app)
-            note_dependencies(app, renderer.dependencies())
+            note_dependencies(app, renderer)
             return renderer.rst_nodes()
 
     return AutoFunctionDirective
@@ -81,7 +166,7 @@ def auto_class_directive_bound_to_app(app):
 
         def run(self):
             renderer = AutoClassRenderer.from_directive(self, app)
-            note_dependencies(app, renderer.dependencies())
+            note_dependencies(app, renderer)
             return renderer.rst_nodes()
 
     return AutoClassDirective
@@ -96,7 +181,7 @@ def auto_attribute_directive_bound_to_app(app):
         """
         def run(self):
             renderer = AutoAttributeRenderer.from_directive(self, app)
-            note_dependencies(app, renderer.dependencies())
+            note_dependencies(app, renderer)
             return renderer.rst_nodes()
 
     return AutoAttributeDirective
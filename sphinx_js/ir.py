@@ -71,6 +71,10 @@ class _NoDefault:
     ``Param.has_default`` first."""
     def __repr__(self):
         return '<no default value>'
+
+    def __reduce__(self):
+        # Unpickle to the same singleton, so identity checks keep working.
+        return 'NO_DEFAULT'
 NO_DEFAULT = _NoDefault()
 
 
@@ -114,6 +118,12 @@ class Param:
             raise ValueError('Tried to construct a Param with has_default=True but without `default` specified.')
         self.default = default
 
+    def __repr__(self):
+        # The generated repr leaves out InitVars, but render keys are made
+        # from reprs, so a changed default has to show.
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % item for item in vars(self).items()))
+
 
 @dataclass
 class Exc:
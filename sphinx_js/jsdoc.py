@@ -4,19 +4,27 @@ Analyzers run jsdoc or typedoc or whatever, squirrel away their output, and
 then lazily constitute IR objects as requested.
 
 """
-from codecs import getreader, getwriter
+from codecs import getreader
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from errno import ENOENT
+from functools import lru_cache
+from heapq import heappop, heappush
 from json import load, dumps
-from os.path import join, normpath, relpath, splitext, sep
+from os import listdir
+from os.path import getsize, isdir, join, normpath, relpath, splitext, sep
+import re
 import subprocess
-from tempfile import TemporaryFile
 
 from sphinx.errors import SphinxError
 
-from .analyzer_utils import cache_to_file, Command, is_explicitly_rooted
+from .analyzer_utils import (cache_to_file, Command, file_digest, fingerprint,
+                             IrCache, is_explicitly_rooted, iter_json_array,
+                             load_cache, parallel_jobs, save_cache,
+                             source_manifest, stale_files, tool_version)
+from .sidecar import run_in_sidecar, sidecar_address, SidecarUnavailable
 from .ir import Attribute, Class, Exc, Function, NO_DEFAULT, Param, Pathname, Return
-from .parsers import path_and_formal_params, PathVisitor
+from .parsers import parse_path, scan_middle_segments, scan_name, scan_relative_dirs
 from .suffix_tree import SuffixTree
 
 
@@ -35,18 +43,8 @@ class Analyzer:
 
         """
         self._base_dir = base_dir
-        # 2 doclets are made for classes, and they are largely redundant: one
-        # for the class itself and another for the constructor. However, the
-        # constructor one gets merged into the class one and is intentionally
-        # marked as undocumented, even if it isn't. See
-        # https://github.com/jsdoc3/jsdoc/issues/1129.
-        doclets = [doclet for doclet in json if doclet.get('comment') and
-                                                not doclet.get('undocumented')]
-
         # Build table for lookup by name, which most directives use:
         self._doclets_by_path = SuffixTree()
-        self._doclets_by_path.add_many((full_path_segments(d, base_dir), d)
-                                       for d in doclets)
 
         # Build lookup table for autoclass's :members: option. This will also
         # pick up members of functions (inner variables), but it will instantly
@@ -59,21 +57,156 @@ class Analyzer:
         # This will lead to multiple methods having each other's members. But
         # if you don't have same-named inner functions or inner variables that
         # are documented, you shouldn't have trouble.
-        self._doclets_by_class = defaultdict(lambda: [])
+        self._doclets_by_class = defaultdict(list)
+
+        # Build lookup table by source file, so we can swap out the doclets of
+        # changed files without redoing everything:
+        self._doclets_by_file = defaultdict(list)
+
+        # IR objects converted so far, by (full path, as_type), so pages that
+        # refer to the same things don't convert them again. Its bounds can be
+        # changed by replacing it.
+        self.ir_cache = IrCache()
+
+        self._add_doclets(documented_doclets(json))
+
+    def _add_doclets(self, doclets):
+        """Index some documented doclets."""
+        doclets = list(doclets)
+        self._doclets_by_path.add_many((full_path_segments(d, self._base_dir), d)
+                                       for d in doclets)
         for d in doclets:
+            self._doclets_by_file[source_file(d)].append(d)
             of = d.get('memberof')
             if of:  # speed optimization
-                segments = full_path_segments(d, base_dir, longname_field='memberof')
+                segments = full_path_segments(d, self._base_dir, longname_field='memberof')
                 self._doclets_by_class[tuple(segments)].append(d)
 
+    def splice(self, json, filenames):
+        """Replace the doclets from some source files with ones from fresh
+        jsdoc output.
+
+        :arg json: The loaded JSON output from running jsdoc over (at least)
+            those of ``filenames`` that still exist
+        :arg filenames: Absolute paths of the source files that were added,
+            changed, or removed
+
+        """
+        self.ir_cache.clear()
+        filenames = set(filenames)
+        for filename in filenames:
+            for d in self._doclets_by_file.pop(filename, []):
+                self._doclets_by_path.remove(full_path_segments(d, self._base_dir))
+                if d.get('memberof'):
+                    of = tuple(full_path_segments(d, self._base_dir, longname_field='memberof'))
+                    members = [m for m in self._doclets_by_class[of] if m is not d]
+                    if members:
+                        self._doclets_by_class[of] = members
+                    else:
+                        del self._doclets_by_class[of]
+        self._add_doclets(d for d in documented_doclets(json)
+                          if source_file(d) in filenames)
+
+    def doclets(self):
+        """Return all the documented doclets, grouped by source file."""
+        return [d for doclets in self._doclets_by_file.values() for d in doclets]
+
+    def index_suffixes(self, max_suffix_length=None):
+        """Precompute path-suffix lookups. See SuffixTree.build_index()."""
+        return self._doclets_by_path.build_index(max_suffix_length)
+
     @classmethod
     def from_disk(cls, abs_source_paths, app, base_dir):
-        json = jsdoc_output(getattr(app.config, 'jsdoc_cache', None),
-                            abs_source_paths,
-                            base_dir,
-                            app.confdir,
-                            getattr(app.config, 'jsdoc_config_path', None))
-        return cls(json, base_dir)
+        args = (app.config.jsdoc_cache,
+                abs_source_paths,
+                base_dir,
+                app.confdir,
+                app.config.jsdoc_config_path,
+                parallel_jobs(app.config.jsdoc_parallel_jobs),
+                app.config.js_sidecar and sidecar_address())
+        if app.config.jsdoc_cache and app.config.jsdoc_incremental:
+            return cls._from_disk_incrementally(*args)
+        return cls(jsdoc_output(*args), base_dir)
+
+    @classmethod
+    def _from_disk_incrementally(cls, cache, abs_source_paths, base_dir, sphinx_conf_dir, config_path, jobs,
+                                 sidecar):
+        """Return an analyzer built from the doclets in the cache, with jsdoc
+        rerun over only the source files that changed since it was written.
+
+        If anything besides the source files changed, start from scratch.
+
+        """
+        source_files, settings = _jsdoc_cache_inputs(
+            cache, abs_source_paths, base_dir, sphinx_conf_dir, config_path)
+        settings = fingerprint(settings)
+        cached = load_cache(cache)
+        manifest = source_manifest(source_files,
+                                   previous=cached and cached['manifest'])
+        if not cached or cached['settings'] != settings:
+            analyzer = cls(jsdoc_output(None, abs_source_paths, base_dir, sphinx_conf_dir, config_path, jobs,
+                                        sidecar),
+                           base_dir)
+        else:
+            analyzer = cls(cached['output'], base_dir)
+            stale = stale_files(cached['manifest'], manifest)
+            if not stale:
+                return analyzer
+            analyzer._rerun(stale, manifest, sphinx_conf_dir, config_path, jobs, sidecar)
+        save_cache(cache, settings, manifest, analyzer.doclets())
+        return analyzer
+
+    @classmethod
+    def cache_inputs(cls, abs_source_paths, app, base_dir):
+        """Return everything that can change an analyzer made by
+        ``from_disk()``, in the form ``snapshotted()`` expects."""
+        source_files, settings = _jsdoc_cache_inputs(
+            None, abs_source_paths, base_dir, app.confdir, app.config.jsdoc_config_path)
+        return source_files, dict(settings, analyzer='jsdoc', base_dir=base_dir)
+
+    def update_from_disk(self, stale, manifest, app):
+        """Bring an analyzer restored from a snapshot up to date by rerunning
+        jsdoc over just the source files that were added, changed, or removed.
+
+        Return None, so the caller starts over, unless ``jsdoc_incremental``
+        says that's okay.
+
+        """
+        if not app.config.jsdoc_incremental:
+            return None
+        self._rerun(stale,
+                    manifest,
+                    app.confdir,
+                    app.config.jsdoc_config_path,
+                    parallel_jobs(app.config.jsdoc_parallel_jobs),
+                    app.config.js_sidecar and sidecar_address())
+        return self
+
+    def _rerun(self, stale, manifest, sphinx_conf_dir, config_path, jobs, sidecar=None):
+        """Rerun jsdoc over those of some stale source files that are still in
+        the manifest of source files, and splice the results in.
+
+        jsdoc copies inherited, mixed-in, and borrowed members from one file
+        into another only when it reads both in the same run, so also rerun
+        every file linked to the stale ones that way, before or after the
+        change. Files linked to removed ones are rerun too, without them.
+
+        """
+        stale = set(stale)
+        present = {f for f in stale if f in manifest}
+        links = file_links(self.doclets(), scanned=present)
+        files, output = set(), []
+        while True:
+            more = {f for f in linked_files(stale, links) if f in manifest}
+            if more == files:
+                break
+            files = more
+            output = jsdoc_output(None, sorted(files), self._base_dir, sphinx_conf_dir, config_path, jobs,
+                                  sidecar)
+            # What the fresh output refers to may be defined in a file that
+            # wasn't rerun, so look there too, after the fresh definitions.
+            links |= file_links(output + self.doclets())
+        self.splice(output, files | stale)
 
     def get_object(self, path_suffix, as_type):
         """Return the IR object with the given path suffix.
@@ -99,7 +232,8 @@ class Analyzer:
             raise NotImplementedError('Unknown autodoc directive: auto%s' % as_type)
 
         doclet, full_path = self._doclets_by_path.get_with_path(path_suffix)
-        return doclet_as_whatever(doclet, full_path)
+        return self.ir_cache.get((tuple(full_path), as_type),
+                                 lambda: doclet_as_whatever(doclet, full_path))
 
     def _doclet_as_class(self, doclet, full_path):
         # This is an instance method so it can get at the base dir.
@@ -108,8 +242,12 @@ class Analyzer:
             kind = member_doclet.get('kind')
             member_full_path = full_path_segments(member_doclet, self._base_dir)
             # Typedefs should still fit into function-shaped holes:
-            doclet_as_whatever = self._doclet_as_function if (kind == 'function' or kind == 'typedef') else self._doclet_as_attribute
-            member = doclet_as_whatever(member_doclet, member_full_path)
+            as_type, doclet_as_whatever = (
+                ('function', self._doclet_as_function) if (kind == 'function' or kind == 'typedef')
+                else ('attribute', self._doclet_as_attribute))
+            member = self.ir_cache.get(
+                (tuple(member_full_path), as_type),
+                lambda: doclet_as_whatever(member_doclet, member_full_path))
             members.append(member)
         return Class(
             description=doclet.get('classdesc', ''),
@@ -150,6 +288,25 @@ class Analyzer:
         )
 
 
+def documented_doclets(json):
+    """Return the doclets of some jsdoc output that are worth indexing."""
+    return (doclet for doclet in json if is_documented(doclet))
+
+
+def is_documented(doclet):
+    # 2 doclets are made for classes, and they are largely redundant: one
+    # for the class itself and another for the constructor. However, the
+    # constructor one gets merged into the class one and is intentionally
+    # marked as undocumented, even if it isn't. See
+    # https://github.com/jsdoc3/jsdoc/issues/1129.
+    return doclet.get('comment') and not doclet.get('undocumented')
+
+
+def source_file(doclet):
+    """Return the absolute path of the file a doclet came from."""
+    return join(doclet['meta']['path'], doclet['meta']['filename'])
+
+
 def is_private(doclet):
     return doclet.get('access') == 'private'
 
@@ -170,45 +327,398 @@ def full_path_segments(d, base_dir, longname_field='longname'):
         for the long name of the object to emit a path to
     """
     meta = d['meta']
-    rel = relpath(meta['path'], base_dir)
+    prefix = _file_path_prefix(meta['path'], meta['filename'], base_dir)
+    longname = d[longname_field]
+    file_segments = _file_path_segments(prefix)
+    object_segments = _object_path_segments(longname)
+    if file_segments is None or object_segments is None:
+        # Something odd, like a backslash escaping the dot between the file and
+        # the longname. Parse the whole thing in one go, which also produces
+        # the right exception if it isn't a path at all.
+        return parse_path(prefix + longname)
+    return list(file_segments + object_segments)
+
+
+@lru_cache(maxsize=None)
+def _file_path_prefix(path, filename, base_dir):
+    """Return the part of a doclet's full path that comes from the file it's
+    in, e.g. ``./dir/file.``.
+
+    There is one of these per source file, so it's worth remembering them
+    rather than recomputing the relpath for every doclet.
+
+    """
+    rel = relpath(path, base_dir)
     rel = '/'.join(rel.split(sep))
     rooted_rel = rel if is_explicitly_rooted(rel) else './%s' % rel
+    return '%s/%s.' % (rooted_rel, splitext(filename)[0])
 
-    # Building up a string and then parsing it back down again is probably
-    # not the fastest approach, but it means knowledge of path format is in
-    # one place: the parser.
-    path = '%s/%s.%s' % (rooted_rel,
-                         splitext(meta['filename'])[0],
-                         d[longname_field])
-    return PathVisitor().visit(
-        path_and_formal_params['path'].parse(path))
 
+@lru_cache(maxsize=None)
+def _file_path_segments(prefix):
+    """Return a tuple of the segments of a file path prefix, or None if the
+    prefix doesn't divide cleanly into segments on its own.
+
+    Because the grammar never backtracks, a prefix that scans cleanly to its
+    end yields the same segments as it would at the front of a full path.
+
+    """
+    segments, pos = scan_relative_dirs(prefix, 0)
+    middle_segments, pos = scan_middle_segments(prefix, pos)
+    if pos != len(prefix):
+        return None
+    return tuple(segments + middle_segments)
 
-@cache_to_file(lambda cache, *args: cache)
-def jsdoc_output(cache, abs_source_paths, base_dir, sphinx_conf_dir, config_path=None):
+
+@lru_cache(maxsize=1 << 16)
+def _object_path_segments(longname):
+    """Return a tuple of the segments of a longname that follows a file path
+    prefix, or None if it isn't a well-formed remainder of a path.
+
+    Memberof fields repeat a lot, so we remember recent ones.
+
+    """
+    segments, pos = scan_middle_segments(longname, 0)
+    name, end = scan_name(longname, pos)
+    if name is None or end != len(longname):
+        return None
+    segments.append(name)
+    return tuple(segments)
+
+
+#: What jsdoc matches filenames against if its config doesn't say otherwise.
+#: By default, it skips any path with a component starting with an underscore.
+DEFAULT_INCLUDE_PATTERN = r'.+\.js(doc|x)?$'
+DEFAULT_EXCLUDE_PATTERN = r'(^|\/|\\)_'
+
+
+def jsdoc_config(config_file):
+    """Return the parsed contents of a jsdoc config file, or an empty dict if
+    there isn't one we can read.
+
+    jsdoc tolerates comments in its config files and also accepts JS modules.
+    We don't; for those, we assume jsdoc's defaults when working out which
+    files it will read.
+
+    """
+    if not config_file:
+        return {}
+    try:
+        with open(config_file, encoding='utf-8') as f:
+            config = load(f)
+    except (OSError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def jsdoc_source_files(abs_source_paths, sphinx_conf_dir, config):
+    """Return the absolute paths of the source files jsdoc will read, sorted.
+
+    This mirrors jsdoc's own scanner and filter: the ``source.include``,
+    ``source.exclude``, ``source.includePattern``, and
+    ``source.excludePattern`` config options, plus ``opts.recurse`` and
+    ``recurseDepth`` for descending into subdirectories.
+
+    :arg sphinx_conf_dir: The dir jsdoc runs in, against which relative paths
+        in its config are resolved
+    :arg config: The parsed jsdoc config, as from :func:`jsdoc_config`
+
+    """
+    source = config.get('source', {})
+    include_pattern = _compile_js_regex(source.get('includePattern'),
+                                        DEFAULT_INCLUDE_PATTERN)
+    exclude_pattern = _compile_js_regex(source.get('excludePattern'),
+                                        DEFAULT_EXCLUDE_PATTERN)
+    excluded_paths = [normpath(join(sphinx_conf_dir, p)) for p in source.get('exclude', [])]
+    depth = (config.get('recurseDepth', 10)
+             if config.get('opts', {}).get('recurse') else 1)
+
+    def is_included(filename):
+        return (include_pattern.search(filename) and
+                not exclude_pattern.search(filename) and
+                # An excluded path is a file or a whole directory, not a
+                # prefix of names:
+                not any(filename == p or filename.startswith(p.rstrip(sep) + sep)
+                        for p in excluded_paths))
+
+    def files_in(directory, depth):
+        try:
+            entries = sorted(listdir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            path = join(directory, entry)
+            if isdir(path):
+                if depth > 1:
+                    yield from files_in(path, depth - 1)
+            else:
+                yield path
+
+    files = set()
+    for path in list(abs_source_paths) + [normpath(join(sphinx_conf_dir, p))
+                                          for p in source.get('include', [])]:
+        candidates = files_in(path, depth) if isdir(path) else [path]
+        files.update(f for f in candidates if is_included(f))
+    return sorted(files)
+
+
+def _compile_js_regex(pattern, default):
+    """Compile a regex from a jsdoc config, falling back to a default if it
+    uses JS syntax Python doesn't understand."""
+    try:
+        return re.compile(pattern or default)
+    except re.error:
+        return re.compile(default)
+
+
+def _jsdoc_cache_inputs(cache, abs_source_paths, base_dir, sphinx_conf_dir, config_path=None, jobs=1,
+                        sidecar=None):
+    """Return everything that can change the output of ``jsdoc_output()``, in
+    the form ``cache_to_file()`` expects."""
+    config_file = normpath(join(sphinx_conf_dir, config_path)) if config_path else None
+    return (jsdoc_source_files(abs_source_paths, sphinx_conf_dir, jsdoc_config(config_file)),
+            dict(tool='jsdoc',
+                 version=tool_version('jsdoc'),
+                 source_paths=abs_source_paths,
+                 conf_dir=str(sphinx_conf_dir),
+                 config=config_file and file_digest(config_file)))
+
+
+@cache_to_file(lambda cache, *args, **kwargs: cache, _jsdoc_cache_inputs)
+def jsdoc_output(cache, abs_source_paths, base_dir, sphinx_conf_dir, config_path=None, jobs=1,
+                 sidecar=None):
+    """Return the loaded JSON output of jsdoc run over the given paths.
+
+    :arg jobs: The number of jsdoc processes to split the work among. Each
+        gets a share of the source files balanced by size. jsdoc relates
+        doclets by @augments, @mixes, and @borrows only within a run, so
+        shards holding files linked that way are then run again together.
+        The outputs are merged into what a single run would have emitted.
+    :arg sidecar: The address of a helper to run jsdoc in, as from
+        ``sidecar_address()``, or None to start jsdoc ourselves
+
+    """
+    if jobs > 1:
+        config = jsdoc_config(normpath(join(sphinx_conf_dir, config_path)) if config_path else None)
+        files = jsdoc_source_files(abs_source_paths, sphinx_conf_dir, config)
+        if len(files) > 1:
+            def run(shards):
+                with ThreadPoolExecutor(len(shards)) as pool:
+                    return list(pool.map(
+                        lambda shard: _run_jsdoc(shard, sphinx_conf_dir, config_path, sidecar),
+                        shards))
+
+            shards = balanced_shards(files, jobs)
+            outputs = run(shards)
+            groups = joined_shards(files, shards, outputs)
+            if len(groups) < len(shards):
+                order = {file: i for i, file in enumerate(files)}
+                joined = [sorted((f for i in group for f in shards[i]), key=order.get)
+                          for group in groups]
+                rerun = [i for i, group in enumerate(groups) if len(group) > 1]
+                outputs = [outputs[group[0]] for group in groups]
+                for i, output in zip(rerun, run([joined[i] for i in rerun])):
+                    outputs[i] = output
+                shards = joined
+            return merge_shard_outputs(files, shards, outputs)
+    return _run_jsdoc(abs_source_paths, sphinx_conf_dir, config_path, sidecar)
+
+
+def _run_jsdoc(abs_source_paths, sphinx_conf_dir, config_path, sidecar=None):
     command = Command('jsdoc')
     command.add('-X', *abs_source_paths)
     if config_path:
         command.add('-c', normpath(join(sphinx_conf_dir, config_path)))
 
-    # Use a temporary file to handle large output volume. JSDoc defaults to
-    # utf8-encoded output.
-    with getwriter('utf-8')(TemporaryFile(mode='w+b')) as temp:
+    def doclets(stdout):
+        # The output can run to gigabytes, most of it about undocumented
+        # code. Parse it as it streams in, and keep only what we'll use.
+        # JSDoc defaults to utf8-encoded output.
         try:
-            p = subprocess.Popen(command.make(), cwd=sphinx_conf_dir, stdout=temp)
-        except OSError as exc:
-            if exc.errno == ENOENT:
-                raise SphinxError('%s was not found. Install it using "npm install -g jsdoc".' % command.program)
-            else:
-                raise
-        p.wait()
-        # Once output is finished, move back to beginning of file and load it:
-        temp.seek(0)
-        try:
-            return load(getreader('utf-8')(temp))
+            return [slimmed(d) for d in iter_json_array(getreader('utf-8')(stdout))
+                    if is_documented(d) or d.get('kind') == 'package']
         except ValueError:
             raise SphinxError('jsdoc found no JS files in the directories %s. Make sure js_source_path is set correctly in conf.py. It is also possible (though unlikely) that jsdoc emitted invalid JSON.' % abs_source_paths)
 
+    if sidecar:
+        try:
+            return run_in_sidecar(sidecar, command, sphinx_conf_dir, doclets)
+        except SidecarUnavailable:
+            pass  # Start jsdoc ourselves.
+    try:
+        p = subprocess.Popen(command.make(), cwd=sphinx_conf_dir, stdout=subprocess.PIPE)
+    except OSError as exc:
+        if exc.errno == ENOENT:
+            raise SphinxError('%s was not found. Install it using "npm install -g jsdoc".' % command.program)
+        else:
+            raise
+    try:
+        return doclets(p.stdout)
+    finally:
+        p.stdout.close()
+        p.wait()
+
+
+def slimmed(doclet):
+    """Return a doclet with bulky fields we never use removed.
+
+    The source text of each symbol's value and the table of inner variables
+    can dwarf the rest of the doclet.
+
+    """
+    meta = doclet.get('meta')
+    if meta:
+        meta.pop('vars', None)
+        meta.get('code', {}).pop('value', None)
+    return doclet
+
+
+def balanced_shards(files, count):
+    """Split files into at most ``count`` lists of roughly equal total size.
+
+    Hand out files biggest first, each to the currently lightest shard.
+
+    """
+    heap = [(0, i, []) for i in range(min(count, len(files)))]
+    for file in sorted(files, key=_file_size, reverse=True):
+        size, i, shard = heappop(heap)
+        shard.append(file)
+        heappush(heap, (size + _file_size(file), i, shard))
+    return [sorted(shard) for _, _, shard in sorted(heap, key=lambda s: s[1])]
+
+
+def _file_size(filename):
+    try:
+        return getsize(filename)
+    except OSError:
+        return 0
+
+
+#: Matches the name a @borrows tag borrows from
+BORROWS = re.compile(r'@borrows\s+(\S+)')
+
+
+def file_links(doclets, scanned=()):
+    """Return the pairs of source files jsdoc must read in the same run to
+    relate their doclets, each as (the file that refers, the file referred
+    to).
+
+    Files are linked by @augments, @mixes, and @borrows, and by a doclet being
+    a member of something documented in another file, as are the members jsdoc
+    copies in by those tags. Doclets keep what they augment and mix in even
+    when jsdoc can't find it, but a @borrows it can't resolve leaves no trace,
+    so those tags are looked for in the text of the ``scanned`` files.
+
+    """
+    doclets = [d for d in doclets if 'meta' in d]
+    defined_in = {}
+    for d in doclets:
+        if not (d.get('inherited') or d.get('mixed')):
+            defined_in.setdefault(d['longname'], source_file(d))
+    links = set()
+
+    def link(file, longname):
+        other = defined_in.get(longname)
+        if other is not None and other != file:
+            links.add((file, other))
+
+    for d in doclets:
+        file = source_file(d)
+        for longname in d.get('augments', []) + d.get('mixes', []) + [d.get('memberof')]:
+            link(file, longname)
+        for borrowed in d.get('borrowed', []):
+            link(file, borrowed['from'])
+    for file in scanned:
+        try:
+            with open(file, encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError:
+            continue
+        for longname in BORROWS.findall(text):
+            link(file, longname)
+    return links
+
+
+def linked_files(files, links):
+    """Return a set of some files and all the others linked to them, directly
+    or through others, in either direction.
+
+    :arg links: Pairs of linked files, as from ``file_links()``
+
+    """
+    neighbors = defaultdict(set)
+    for a, b in links:
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    found = set(files)
+    todo = list(found)
+    while todo:
+        for other in neighbors[todo.pop()] - found:
+            found.add(other)
+            todo.append(other)
+    return found
+
+
+def joined_shards(files, shards, outputs):
+    """Return the indices of the shards of a sharded jsdoc run grouped so
+    that files which jsdoc needs to read together, as linked by
+    ``file_links()``, are in the same group.
+
+    :arg files: All the source files
+    :arg shards: Lists of the source files each run was given
+    :arg outputs: The loaded JSON output of each run
+
+    """
+    owner = {file: i for i, shard in enumerate(shards) for file in shard}
+    # Like merge_shard_outputs(), take each file's doclets from its own run.
+    owned = [d for i, output in enumerate(outputs) for d in output
+             if 'meta' in d and owner.get(source_file(d)) == i]
+    groups = {i: {i} for i in range(len(shards))}
+    for a, b in file_links(owned, scanned=files):
+        if a in owner and b in owner and groups[owner[a]] is not groups[owner[b]]:
+            group = groups[owner[a]] | groups[owner[b]]
+            for i in group:
+                groups[i] = group
+    return sorted({min(group): sorted(group) for group in groups.values()}.values())
+
+
+def merge_shard_outputs(files, shards, outputs):
+    """Combine the outputs of jsdoc runs over separate shards of the source
+    files into what a single run over all of them would have emitted.
+
+    Doclets are put back in the order of the files they came from, and the
+    per-run package doclets are combined into one. Since no file is split
+    across shards, everything jsdoc relates within a file, like a class and
+    its members, is intact. Relationships between doclets in different files,
+    like ``memberof``, are by name and resolve once the doclets are indexed
+    together, except those jsdoc resolves itself by copying members, which
+    ``joined_shards()`` keeps within a shard.
+
+    :arg files: All the source files, in the order jsdoc would read them
+    :arg shards: Lists of the source files each run was given
+    :arg outputs: The loaded JSON output of each run
+
+    """
+    order = {file: i for i, file in enumerate(files)}
+    doclets = []
+    package = None
+    for shard, output in zip(shards, outputs):
+        shard = set(shard)
+        for doclet in output:
+            if doclet.get('kind') == 'package':
+                if package is None:
+                    package = dict(doclet, files=[])
+                package['files'].extend(doclet.get('files', []))
+            # Config like source.include adds the same files to every run.
+            # Keep only the doclets from the run that owned the file.
+            elif 'meta' not in doclet or source_file(doclet) in shard:
+                doclets.append(doclet)
+    doclets.sort(key=lambda d: order.get(source_file(d), len(files)) if 'meta' in d else len(files))
+    if package is not None:
+        package['files'] = sorted(set(package['files']), key=lambda f: order.get(f, len(files)))
+        doclets.append(package)
+    return doclets
+
 
 def format_default_according_to_type_hints(value, declared_types, first_type_is_string):
     """Return the default value for a param, formatted as a string
@@ -0,0 +1,205 @@
+"""Building the doctrees for our directives straight from the IR, without
+rendering RST through templates and parsing it back
+
+This is what ``js_renderer = 'nodes'`` selects. It runs the same Sphinx
+directives and roles the templates would invoke, so it makes the same nodes,
+but the only RST it parses is what came out of doc comments.
+
+"""
+from functools import lru_cache
+
+from docutils import nodes
+from docutils.parsers.rst import directives, roles
+from docutils.statemachine import StringList, string2lines
+from sphinx import addnodes
+from sphinx.errors import SphinxError
+from sphinx.util.nodes import nested_parse_with_titles
+
+
+class NodeBuilder:
+    """Maker of the nodes making up a rendered entity, all built within the
+    parser state of a directive of ours"""
+
+    def __init__(self, directive, source):
+        """
+        :arg directive: The sphinx-js directive being run
+        :arg source: The name to report as the source of parsed doc comments
+
+        """
+        self._state = directive.state
+        self._state_machine = directive.state_machine
+        self._lineno = directive.lineno
+        self._source = source
+
+    def directive(self, name, arguments, content=None, body=None):
+        """Run a directive, like ``js:function``, and return its nodes.
+
+        :arg body: A function returning nodes to add to the content of an
+            object description, like the fields of a function. It's called
+            while the directive is running so that roles within resolve in its
+            context (for instance, within a class).
+
+        """
+        cls, messages = directives.directive(name,
+                                             self._state.memo.language,
+                                             self._state.document)
+        if cls is None:
+            raise SphinxError('Unknown directive type "%s".' % name)
+        if body is not None:
+            cls = _with_body(cls)
+        directive = cls(name,
+                        arguments,
+                        {},
+                        content or StringList(),
+                        self._lineno,
+                        0,
+                        '',
+                        self._state,
+                        self._state_machine)
+        directive.sphinxjs_body = body
+        return messages + directive.run()
+
+    def role(self, name, text):
+        """Return the nodes made by a role, like ``js:class``, applied to some
+        text."""
+        role_fn, messages = roles.role(name,
+                                       self._state.memo.language,
+                                       self._lineno,
+                                       self._state.reporter)
+        if role_fn is None:
+            raise SphinxError('Unknown interpreted text role "%s".' % name)
+        made, more_messages = role_fn(name,
+                                      ':%s:`%s`' % (name, text),
+                                      text,
+                                      self._lineno,
+                                      self._state.inliner)
+        return made + messages + more_messages
+
+    def rst(self, text):
+        """Return the nodes parsed from some RST, like a description."""
+        if not text:
+            return []
+        return self.content(self._lines(text))
+
+    def content(self, lines):
+        """Return the nodes parsed from a StringList of RST."""
+        container = nodes.Element()
+        nested_parse_with_titles(self._state, lines, container)
+        return container.children
+
+    def inline(self, text):
+        """Return the nodes parsed from some inline RST."""
+        made, messages = self._state.inline_text(text, self._lineno)
+        return made + messages
+
+    def paragraph(self, *children):
+        """Return a paragraph of the given nodes, in a list."""
+        return [nodes.paragraph('', '', *children)]
+
+    def emphasis(self, text):
+        return nodes.emphasis(text, text)
+
+    def strong(self, text):
+        return nodes.strong(text, text)
+
+    def deprecated(self, message):
+        """Return a note that something is deprecated, with a message if it's
+        a string."""
+        if not message:
+            return []
+        note = nodes.note()
+        if isinstance(message, str):
+            note.extend(self.rst('Deprecated: ' + message))
+        else:
+            note.extend(self.paragraph(nodes.Text('Deprecated.')))
+        return [note]
+
+    def fields(self, fields):
+        """Return a field list of ``(heads, tail)`` pairs.
+
+        The heads are escaped RST, and the tail is RST on a single line, as
+        made by ``JsRenderer._fields()``.
+
+        """
+        field_list = nodes.field_list()
+        for heads, tail in fields:
+            body = nodes.field_body()
+            tail = tail.strip()
+            if tail:
+                self._state.nested_parse(self._lines(tail), 0, body)
+            field_list += nodes.field('',
+                                      nodes.field_name('', '', *self.inline(' '.join(heads))),
+                                      body)
+        return [field_list] if field_list.children else []
+
+    def examples(self, examples):
+        """Return a heading and a code block for each example."""
+        if not examples:
+            return []
+        made = self.paragraph(self.strong('Examples:'))
+        for example in examples:
+            made.extend(self.directive('code-block', ['js'], _dedented(self._lines(example))))
+        return made
+
+    def exported_from(self, pathname):
+        """Return a note of the module something is exported from."""
+        if not pathname:
+            return []
+        return self.paragraph(self.emphasis('exported from'),
+                              nodes.Text(' '),
+                              *self.role('js:mod', pathname.dotted()))
+
+    def pathnames(self, heading, pathnames):
+        """Return a heading over a list of links to the classes at some
+        pathnames, as for superclasses."""
+        if not pathnames:
+            return []
+        items = nodes.bullet_list(bullet='-')
+        for pathname in pathnames:
+            items += nodes.list_item('', *self.paragraph(*self.role('js:class', '~' + pathname.dotted())))
+        return [nodes.definition_list(
+            '',
+            nodes.definition_list_item('',
+                                       nodes.term('', '', self.strong(heading)),
+                                       nodes.definition('', items)))]
+
+    def see_also(self, references):
+        """Return a "see also" box linking to the given references."""
+        if not references:
+            return []
+        items = nodes.bullet_list(bullet='-')
+        for reference in references:
+            items += nodes.list_item('', *self.paragraph(*self.role('any', reference)))
+        return [addnodes.seealso('', items)]
+
+    def _lines(self, text):
+        return StringList(string2lines(text,
+                                       self._state.document.settings.tab_width,
+                                       convert_whitespace=True),
+                          source=self._source)
+
+
+@lru_cache(maxsize=None)
+def _with_body(cls):
+    """Return a subclass of an object-description directive class which adds
+    the nodes returned by its ``sphinxjs_body()`` to its content."""
+    class WithBody(cls):
+        def transform_content(self, contentnode):
+            super().transform_content(contentnode)
+            contentnode.extend(self.sphinxjs_body())
+
+    WithBody.__name__ = cls.__name__
+    return WithBody
+
+
+def _dedented(lines):
+    """Return a StringList with its blank lines at the ends and its common
+    indentation removed, as docutils does to the content of a directive."""
+    while lines and not lines[0].strip():
+        lines.trim_start()
+    while lines and not lines[-1].strip():
+        lines.trim_end()
+    indents = [len(line) - len(line.lstrip()) for line in lines if line.strip()]
+    if indents:
+        lines.trim_left(min(indents))
+    return lines
@@ -0,0 +1,213 @@
+"""Caches of rendered RST and parsed nodes, kept across builds alongside the
+Sphinx environment
+
+The RST for an entity depends only on its IR object, the renderer, the
+arguments, options, and content of the directive, and the templates. We
+fingerprint all of those, so an entity is rendered again only when one of them
+has changed, no matter how many pages, builders, or builds it shows up in.
+Likewise, the nodes parsed from some RST are reused as long as the RST and the
+context it's parsed in stay the same.
+
+"""
+from collections import OrderedDict
+from hashlib import sha256
+import os
+from os.path import join
+import pickle
+
+
+#: Bump this when the layout of the cache file changes so old ones are ignored
+#: rather than misread.
+RENDER_CACHE_FORMAT = 2
+
+
+class RenderCache:
+    """A least-recently-used map of fingerprints to renderings, bounded by
+    their total size"""
+
+    def __init__(self, budget):
+        #: The most total size to keep
+        self.budget = budget
+        self._entries = OrderedDict()
+        self._size = 0
+        #: Whether anything has been added since the cache was loaded
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value stored under a key, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size=None):
+        """Store a value, evicting the least recently used entries as needed
+        to stay within budget.
+
+        :arg size: How much of the budget the value takes up. Defaults to its
+            length.
+        """
+        if size is None:
+            size = len(value)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old[1]
+        self._entries[key] = value, size
+        self._size += size
+        self.dirty = True
+        while self._size > self.budget and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+
+def render_key(*parts):
+    """Return a fingerprint of some reprs: the things a rendering depends
+    on. Any sets among them are put in order first."""
+    return sha256(repr(_canonical(parts)).encode('utf-8')).digest()
+
+
+#: The caches we keep, by name, and the config values that set their budgets
+CACHES = {'renders': 'js_render_cache_size',
+          'nodes': 'js_node_cache_size'}
+
+
+def _cache_filename(app, name):
+    return join(app.doctreedir, 'sphinx_js_%s.pickle' % name)
+
+
+def _context(app, name):
+    """Return a fingerprint of what a whole cache depends on beyond its
+    keys.
+
+    Config values which affect the environment can affect how directives
+    parse, so the nodes cache depends on those.
+
+    """
+    if name != 'nodes':
+        return None
+    return render_key(sorted((item.name, item.value) for item in app.config
+                             if item.rebuild == 'env'))
+
+
+def _canonical(value):
+    """Return a value with any sets in it, however deep, swapped for sorted
+    lists, so its repr is the same from build to build. The order of a set
+    depends on how it was built and, for strings, on hash randomization."""
+    if isinstance(value, (set, frozenset)):
+        return (type(value).__name__, sorted((_canonical(v) for v in value), key=repr))
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def load_render_caches(app):
+    """Load the caches from the last build, or start empty ones.
+
+    Stash them on the app, where renderers can find them. A cache whose budget
+    is 0 is turned off.
+
+    """
+    app._sphinxjs_caches = {}
+    app._sphinxjs_cache_contexts = {}
+    for name, setting in CACHES.items():
+        budget = getattr(app.config, setting)
+        if not budget:
+            continue
+        context = app._sphinxjs_cache_contexts[name] = _context(app, name)
+        cache = None
+        try:
+            with open(_cache_filename(app, name), 'rb') as f:
+                record = pickle.load(f)
+            if (record['format'] == RENDER_CACHE_FORMAT and
+                    record['context'] == context):
+                cache = record['cache']
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError, IndexError, KeyError, TypeError, ValueError):
+            # It's missing, truncated, or written by an incompatible version.
+            pass
+        if cache is None:
+            cache = RenderCache(budget)
+        cache.budget = budget
+        cache.dirty = False
+        app._sphinxjs_caches[name] = cache
+
+
+def cache_get(app, name, key):
+    """Return the value stored under a key in one of the caches, or None if
+    it isn't there or the cache is turned off."""
+    cache = app._sphinxjs_caches.get(name)
+    return None if cache is None else cache.get(key)
+
+
+def cache_fits(app, name, size):
+    """Return whether one of the caches is turned on and has room for a value
+    of some size, so callers can skip preparing values it would drop."""
+    cache = app._sphinxjs_caches.get(name)
+    return cache is not None and size <= cache.budget
+
+
+def cache_put(app, name, key, value, size=None):
+    """Store a value in one of the caches, if it's turned on.
+
+    In a parallel reader, also note the value on the environment so it can
+    be merged back into the main process's cache.
+
+    """
+    cache = app._sphinxjs_caches.get(name)
+    if cache is None:
+        return
+    if size is None:
+        size = len(value)
+    cache.put(key, value, size)
+    if app.parallel > 1:
+        new = getattr(app.env, 'sphinxjs_new_cache_entries', None)
+        if new is None:
+            new = app.env.sphinxjs_new_cache_entries = []
+        new.append((name, key, value, size))
+
+
+def cached_render(app, key, render):
+    """Return the RST cached under a key, or call ``render()`` to make and
+    cache it."""
+    rst = cache_get(app, 'renders', key)
+    if rst is None:
+        rst = render()
+        cache_put(app, 'renders', key, rst)
+    return rst
+
+
+def merge_render_caches(app, env, docnames, other):
+    """Add values cached by a parallel reader to the main caches."""
+    for name, key, value, size in getattr(other,
+                                          'sphinxjs_new_cache_entries',
+                                          []):
+        app._sphinxjs_caches[name].put(key, value, size)
+
+
+def forget_new_cache_entries(app, env):
+    """Keep the values noted for merging out of the pickled environment."""
+    if hasattr(env, 'sphinxjs_new_cache_entries'):
+        del env.sphinxjs_new_cache_entries
+
+
+def save_render_caches(app, exception):
+    """Write out any caches that were added to, atomically."""
+    if exception is not None:
+        return
+    for name, cache in getattr(app, '_sphinxjs_caches', {}).items():
+        if cache.dirty:
+            filename = _cache_filename(app, name)
+            temp = filename + '.tmp'
+            with open(temp, 'wb') as f:
+                pickle.dump(dict(format=RENDER_CACHE_FORMAT,
+                                 context=app._sphinxjs_cache_contexts[name],
+                                 cache=cache),
+                            f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, filename)
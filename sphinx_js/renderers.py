@@ -1,20 +1,31 @@
+import os
+from os.path import join
 from re import sub
 
+from docutils.nodes import Element
 from docutils.parsers.rst import Parser as RstParser
 from docutils.statemachine import StringList
 from docutils.utils import new_document
-from jinja2 import Environment, PackageLoader
+from jinja2 import (ChoiceLoader, Environment, FileSystemBytecodeCache,
+                    FileSystemLoader, PackageLoader)
+from sphinx import addnodes
 from sphinx.errors import SphinxError
 from sphinx.util import logging, rst
 
 from .analyzer_utils import dotted_path
 from .ir import Class, Function, Interface, Pathname
-from .parsers import PathVisitor
+from .node_builder import NodeBuilder
+from .parsers import parse_path_and_formal_params
+from .render_cache import (cache_fits, cache_get, cache_put, cached_render,
+                           render_key)
 from .suffix_tree import SuffixAmbiguous, SuffixNotFound
 
 
 logger = logging.getLogger(__name__)
 
+#: One parser reused for all directives; it keeps no state between parses.
+_rst_parser = RstParser()
+
 
 class JsRenderer(object):
     """Abstract superclass for renderers of various sphinx-js directives
@@ -38,7 +49,7 @@ class JsRenderer(object):
         # on the instance so calls to template_vars don't need to concern
         # themselves with what it needs.
         self._app = app
-        self._partial_path, self._explicit_formal_params = PathVisitor().parse(arguments[0])
+        self._partial_path, self._explicit_formal_params = parse_path_and_formal_params(arguments[0])
         self._content = content or StringList()
         self._options = options or {}
 
@@ -60,6 +71,11 @@ class JsRenderer(object):
                    content=directive.content,
                    options=directive.options)
 
+    def object_key(self):
+        """Return the path suffix and type hint the IR object rendered by
+        this renderer is looked up by, as a hashable tuple."""
+        return tuple(self._partial_path), self._renderer_type
+
     def get_object(self):
         """Return the IR object rendered by this renderer.
 
@@ -75,19 +91,28 @@ class JsRenderer(object):
             raise SphinxError('More than one object matches the path suffix "%s". Candidate paths have these segments in front: %s'
                               % (''.join(exc.segments), exc.next_possible_keys))
 
+    def template_dependencies(self):
+        """Return a set of the absolute paths of the overridden templates
+        this renderer uses."""
+        return (set() if self._app.config.js_renderer == 'nodes' else
+                set(template_environment(self._app).overrides))
+
     def dependencies(self):
         """Return a set of path(s) to the file(s) that the IR object
         rendered by this renderer is from.  Each path is absolute or
         relative to `root_for_relative_js_paths`.
 
         """
+        # Overridden templates are absolute paths, which come through joins
+        # with the root unscathed.
+        deps = self.template_dependencies()
         try:
             obj = self.get_object()
             if obj.deppath:
-                return set([obj.deppath])
+                deps.add(obj.deppath)
         except SphinxError as exc:
             logger.exception('Exception while retrieving paths for IR object: %s' % exc)
-        return set([])
+        return deps
 
     def rst_nodes(self):
         """Render into RST nodes a thing shaped like a function, having a name
@@ -97,20 +122,52 @@ class JsRenderer(object):
 
         """
         obj = self.get_object()
+        if self._app.config.js_renderer == 'nodes':
+            return self.nodes(self._partial_path,
+                              obj,
+                              use_short_name='short-name' in self._options)
         rst = self.rst(self._partial_path,
                        obj,
                        use_short_name='short-name' in self._options)
 
         # Parse the RST into docutils nodes with a fresh doc, and return
-        # them.
+        # them, unless we already have parsed the same RST in the same
+        # context:
         #
         # Not sure if passing the settings from the "real" doc is the right
         # thing to do here:
-        doc = new_document('%s:%s(%s)' % (obj.filename,
-                                          obj.path,
-                                          obj.line),
-                           settings=self._directive.state.document.settings)
-        RstParser().parse(rst, doc)
+        settings = self._directive.state.document.settings
+        source = _source_name(obj)
+        env = self._app.env
+        key = render_key(rst,
+                         source,
+                         settings.tab_width,
+                         settings.language_code,
+                         # Parsing a js:class leaves emptied entries behind,
+                         # which mean the same as missing ones:
+                         sorted((k, v) for k, v in env.ref_context.items()
+                                if k.startswith('js:') and v))
+        cached = cache_get(self._app, 'nodes', key)
+        if cached is not None:
+            nodes = [node.deepcopy() for node in cached]
+            _rehome(env, nodes)
+            _note_objects(env, nodes)
+            return nodes
+
+        doc = new_document(source, settings=settings)
+        levels = []
+        doc.reporter.attach_observer(lambda message: levels.append(message['level']))
+        _rst_parser.parse(rst, doc)
+        # Don't cache anything which came with warnings, so they keep getting
+        # reported:
+        if (max(levels, default=0) < doc.reporter.WARNING_LEVEL and
+                cache_fits(self._app, 'nodes', len(rst))):
+            stored = [node.deepcopy() for node in doc.children]
+            for node in stored:
+                # Don't drag the throwaway doc along into the pickled cache:
+                for descendant in node.findall():
+                    descendant.document = None
+            cache_put(self._app, 'nodes', key, stored, len(rst))
         return doc.children
 
     def rst(self, partial_path, obj, use_short_name=False):
@@ -118,10 +175,28 @@ class JsRenderer(object):
         object."""
         dotted_name = partial_path[-1] if use_short_name else dotted_path(partial_path)
 
-        # Render to RST using Jinja:
-        env = Environment(loader=PackageLoader('sphinx_js', 'templates'))
-        template = env.get_template(self._template)
-        return template.render(**self._template_vars(dotted_name, obj))
+        # Render to RST using Jinja, unless we already have for the same
+        # inputs:
+        env = template_environment(self._app)
+        key = render_key(type(self).__name__,
+                         dotted_name,
+                         self._explicit_formal_params,
+                         list(self._content),
+                         sorted(self._options.items()),
+                         obj,
+                         env.fingerprint)
+        return cached_render(
+            self._app,
+            key,
+            lambda: env.get_template(self._template).render(**self._template_vars(dotted_name, obj)))
+
+    def nodes(self, partial_path, obj, use_short_name=False):
+        """Return docutils nodes about an entity with the given name and IR
+        object, built straight from the IR rather than by way of RST."""
+        dotted_name = partial_path[-1] if use_short_name else dotted_path(partial_path)
+        return self._nodes(NodeBuilder(self._directive, _source_name(obj)),
+                           dotted_name,
+                           obj)
 
     def _formal_params(self, obj):
         """Return the JS function or class params, looking first to any
@@ -204,12 +279,33 @@ class AutoFunctionRenderer(JsRenderer):
             see_also=obj.see_alsos,
             content='\n'.join(self._content))
 
+    def _nodes(self, build, name, obj):
+        vars = self._template_vars(name, obj)
+        return build.directive(
+            'js:staticfunction' if obj.is_static else 'js:function',
+            [name + ('?' if obj.is_optional else '') + vars['params']],
+            body=lambda: (build.deprecated(obj.deprecated) +
+                          build.rst(obj.description) +
+                          build.fields(vars['fields']) +
+                          build.examples(obj.examples) +
+                          build.content(self._content) +
+                          build.see_also(obj.see_alsos)))
+
 
 class AutoClassRenderer(JsRenderer):
     _template = 'class.rst'
     _renderer_type = 'class'
 
     def _template_vars(self, name, obj):
+        return dict(self._class_vars(name, obj),
+                    members=self._members_of(obj,
+                                             include=self._options['members'],
+                                             exclude=self._options.get('exclude-members', set()),
+                                             should_include_private='private-members' in self._options)
+                            if 'members' in self._options else '')
+
+    def _class_vars(self, name, obj):
+        """Return the template vars about a class, save its members."""
         # TODO: At the moment, we pull most fields (params, returns,
         # exceptions, etc.) off the constructor only. We could pull them off
         # the class itself too in the future.
@@ -252,12 +348,45 @@ class AutoClassRenderer(JsRenderer):
             is_interface=isinstance(obj, Interface),  # TODO: Make interfaces not look so much like classes. This will require taking complete control of templating from Sphinx.
             supers=obj.supers,
             constructor_comment=constructor.description,
-            content='\n'.join(self._content),
-            members=self._members_of(obj,
-                                     include=self._options['members'],
-                                     exclude=self._options.get('exclude-members', set()),
-                                     should_include_private='private-members' in self._options)
-                    if 'members' in self._options else '')
+            content='\n'.join(self._content))
+
+    def _nodes(self, build, name, obj):
+        vars = self._class_vars(name, obj)
+        return build.directive(
+            'js:class',
+            [name + vars['params']],
+            body=lambda: (build.deprecated(vars['deprecated']) +
+                          build.rst(vars['class_comment']) +
+                          (build.paragraph(build.emphasis('abstract'))
+                           if vars['is_abstract'] else []) +
+                          (build.paragraph(build.emphasis('interface'))
+                           if vars['is_interface'] else []) +
+                          build.exported_from(vars['exported_from']) +
+                          build.pathnames('Extends:', vars['supers']) +
+                          build.pathnames('Implements:', vars['interfaces']) +
+                          build.rst(vars['constructor_comment']) +
+                          build.fields(vars['fields']) +
+                          build.examples(vars['examples']) +
+                          build.content(self._content) +
+                          self._member_nodes(obj) +
+                          build.see_also(vars['see_also'])))
+
+    def _member_nodes(self, obj):
+        """Return nodes describing the members of a class, as selected by the
+        directive's options."""
+        if 'members' not in self._options:
+            return []
+        renderer_for = self._member_renderers()
+        made = []
+        for member in self._included_members(
+                obj,
+                include=self._options['members'],
+                exclude=self._options.get('exclude-members', set()),
+                should_include_private='private-members' in self._options):
+            made.extend(renderer_for(member).nodes([member.name],
+                                                   member,
+                                                   use_short_name=False))
+        return made
 
     def _members_of(self, obj, include, exclude, should_include_private):
         """Return RST describing the members of a given class.
@@ -269,60 +398,73 @@ class AutoClassRenderer(JsRenderer):
         :arg should_include_private: Whether to include private members
 
         """
-        def rst_for(obj):
-            renderer = (AutoFunctionRenderer if isinstance(obj, Function)
-                        else AutoAttributeRenderer)
-            return renderer(self._directive, self._app, arguments=['dummy']).rst(
-                [obj.name],
-                obj,
-                use_short_name=False)
-
-        def members_to_include(include):
-            """Return the members that should be included (before excludes and
-            access specifiers are taken into account).
-
-            This will either be the ones explicitly listed after the
-            ``:members:`` option, in that order; all members of the class; or
-            listed members with remaining ones inserted at the placeholder "*".
-
-            """
-            def sort_attributes_first_then_by_path(obj):
-                """Return a sort key for IR objects."""
-                return isinstance(obj, Function), obj.path.segments
-
-            members = obj.members
-            if not include:
-                # Specifying none means listing all.
-                return sorted(members, key=sort_attributes_first_then_by_path)
-            included_set = set(include)
-
-            # If the special name * is included in the list, include all other
-            # members, in sorted order.
-            if '*' in included_set:
-                star_index = include.index('*')
-                sorted_not_included_members = sorted(
-                    (m for m in members if m.name not in included_set),
-                    key=sort_attributes_first_then_by_path
-                )
-                not_included = [m.name for m in sorted_not_included_members]
-                include = include[:star_index] + not_included + include[star_index + 1:]
-                included_set.update(not_included)
-
-            # Even if there are 2 members with the same short name (e.g. a
-            # static member and an instance one), keep them both. This
-            # prefiltering step should make the below sort less horrible, even
-            # though I'm calling index().
-            included_members = [m for m in members if m.name in included_set]
-            # sort()'s stability should keep same-named members in the order
-            # JSDoc spits them out in.
-            included_members.sort(key=lambda m: include.index(m.name))
-            return included_members
-
+        renderer_for = self._member_renderers()
         return '\n\n'.join(
-            rst_for(member) for member in members_to_include(include)
-            if (not member.is_private
-                or (member.is_private and should_include_private))
-            and member.name not in exclude)
+            renderer_for(member).rst([member.name], member, use_short_name=False)
+            for member in self._included_members(
+                obj, include, exclude, should_include_private))
+
+    def _member_renderers(self):
+        """Return a function that returns a renderer for a member, sharing one
+        renderer among all members of the same kind."""
+        renderers = {}
+
+        def renderer_for(member):
+            cls = _member_renderer(member)
+            renderer = renderers.get(cls)
+            if renderer is None:
+                renderer = renderers[cls] = cls(self._directive, self._app, arguments=['dummy'])
+            return renderer
+        return renderer_for
+
+    def _included_members(self, obj, include, exclude, should_include_private):
+        """Return the members of a given class to document, in order.
+
+        These are either the ones explicitly listed after the ``:members:``
+        option, in that order; all members of the class; or listed members
+        with remaining ones inserted at the placeholder "*". Excluded and
+        private ones are then left out unless asked for.
+
+        Takes the same args as :meth:`_members_of()`.
+
+        """
+        def sort_attributes_first_then_by_path(obj):
+            """Return a sort key for IR objects."""
+            return isinstance(obj, Function), obj.path.segments
+
+        def is_wanted(member):
+            return ((should_include_private or not member.is_private) and
+                    member.name not in exclude)
+
+        members = obj.members
+        if not include:
+            # Specifying none means listing all.
+            return sorted(filter(is_wanted, members),
+                          key=sort_attributes_first_then_by_path)
+        included_set = set(include)
+
+        # If the special name * is included in the list, include all other
+        # members, in sorted order.
+        if '*' in included_set:
+            star_index = include.index('*')
+            sorted_not_included_members = sorted(
+                (m for m in members if m.name not in included_set),
+                key=sort_attributes_first_then_by_path
+            )
+            not_included = [m.name for m in sorted_not_included_members]
+            include = include[:star_index] + not_included + include[star_index + 1:]
+
+        # Map each name to where it first appears in the list, rather than
+        # calling index() for every member, which would be quadratic:
+        position = {}
+        for index, name in enumerate(include):
+            position.setdefault(name, index)
+
+        # Even if there are 2 members with the same short name (e.g. a static
+        # member and an instance one), keep them both. sort()'s stability
+        # should keep same-named members in the order JSDoc spits them out in.
+        return sorted((m for m in members if m.name in position and is_wanted(m)),
+                      key=lambda m: position[m.name])
 
 
 class AutoAttributeRenderer(JsRenderer):
@@ -340,6 +482,89 @@ class AutoAttributeRenderer(JsRenderer):
             type=obj.type,
             content='\n'.join(self._content))
 
+    def _nodes(self, build, name, obj):
+        return build.directive(
+            'js:attribute',
+            [name + ('?' if obj.is_optional else '')],
+            body=lambda: (build.deprecated(obj.deprecated) +
+                          (build.paragraph(build.strong('type:'),
+                                           *build.inline(' ' + obj.type))
+                           if obj.type else []) +
+                          build.rst(obj.description) +
+                          build.examples(obj.examples) +
+                          build.content(self._content) +
+                          build.see_also(obj.see_alsos)))
+
+
+def _member_renderer(obj):
+    """Return the renderer class for a member of a class."""
+    return AutoFunctionRenderer if isinstance(obj, Function) else AutoAttributeRenderer
+
+
+def template_environment(app):
+    """Return the Jinja environment that all renderers for an app share,
+    making it on first use.
+
+    Each template is compiled once per build, and the compiled bytecode is
+    kept in the doctree dir for later builds. Templates in the
+    ``js_template_path`` dir, if any, take precedence over ours. Jinja checks
+    cached bytecode against the source it came from, so edits to those never
+    run stale code. The paths of the overriding templates are stored on the
+    environment as ``overrides``, so documents can depend on them, and a hash
+    of all the templates as ``fingerprint``, so renderings can be cached.
+
+    """
+    env = getattr(app, '_sphinxjs_template_env', None)
+    if env is None:
+        loaders = [PackageLoader('sphinx_js', 'templates')]
+        overrides = []
+        if app.config.js_template_path:
+            template_dir = join(app.confdir, app.config.js_template_path)
+            loaders.insert(0, FileSystemLoader(template_dir))
+            overrides = sorted(join(template_dir, name)
+                               for name in FileSystemLoader(template_dir).list_templates())
+        cache_dir = join(app.doctreedir, 'sphinx_js_templates')
+        os.makedirs(cache_dir, exist_ok=True)
+        env = Environment(loader=ChoiceLoader(loaders),
+                          bytecode_cache=FileSystemBytecodeCache(cache_dir),
+                          # Templates don't change during a build:
+                          auto_reload=False)
+        env.overrides = overrides
+        env.fingerprint = render_key(*[(name, env.loader.get_source(env, name)[0])
+                                       for name in env.loader.list_templates()])
+        app._sphinxjs_template_env = env
+    return env
+
+
+def _source_name(obj):
+    """Return the name to report as the source of the RST about an IR
+    object."""
+    return '%s:%s(%s)' % (obj.filename, obj.path, obj.line)
+
+
+def _rehome(env, nodes):
+    """Point the cross-references in some nodes reused from the cache at the
+    current document, since they're resolved relative to the one they're in,
+    not the one that first parsed them."""
+    for node in nodes:
+        for ref in node.findall(lambda n: isinstance(n, Element) and 'refdoc' in n):
+            ref['refdoc'] = env.docname
+
+
+def _note_objects(env, nodes):
+    """Register with the JS domain the objects described in some nodes reused
+    from the cache, as their directives would have while being parsed."""
+    domain = env.get_domain('js')
+    for node in nodes:
+        for sig in node.findall(addnodes.desc_signature):
+            desc = sig.parent
+            if desc.get('domain') == 'js' and sig['ids'] and 'fullname' in sig:
+                module = sig.get('module')
+                domain.note_object((module + '.' if module else '') + sig['fullname'],
+                                   desc['objtype'],
+                                   sig['ids'][0],
+                                   location=sig)
+
 
 def unwrapped(text):
     """Return the text with line wrapping removed."""
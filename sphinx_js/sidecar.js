@@ -0,0 +1,220 @@
+#!/usr/bin/env node
+// The helper that runs JSDoc and TypeDoc for sphinx-js. See sidecar.py.
+//
+// Run as ``node sidecar.js SOCKET`` to serve requests on a Unix socket, or as
+// ``node sidecar.js --worker SCRIPT`` to start a worker, which loads the
+// dependencies of the tool whose command-line script is SCRIPT and then waits
+// for a single job on stdin.
+'use strict';
+
+const childProcess = require('child_process');
+const fs = require('fs');
+const Module = require('module');
+const net = require('net');
+const path = require('path');
+
+// How long to wait for another request before quitting
+const IDLE_MS = 15 * 60 * 1000;
+// How often to check that our socket is still there
+const CHECK_MS = 5 * 1000;
+
+function serve(address) {
+  // Workers started ahead of time, by the tool they're ready to run:
+  const spares = new Map();
+  let connections = 0;
+  let idleTimer = null;
+
+  function quit() {
+    for (const worker of spares.values()) {
+      worker.kill();
+    }
+    server.close();
+    process.exit(0);
+  }
+
+  function spare(script) {
+    const worker = childProcess.spawn(process.execPath,
+                                      [__filename, '--worker', script],
+                                      {stdio: 'pipe'});
+    worker.on('error', () => {});
+    return worker;
+  }
+
+  function takeWorker(script) {
+    // A changed tool needs a worker with its new dependencies loaded.
+    const key = [script, fs.statSync(script).mtimeMs, packageOf(script)].join('\0');
+    let worker = spares.get(key);
+    if (!worker || worker.exitCode !== null || worker.signalCode !== null) {
+      worker = spare(script);
+    }
+    spares.set(key, spare(script));
+    return worker;
+  }
+
+  function run(job, socket) {
+    let worker;
+    try {
+      worker = takeWorker(job.script);
+    } catch (e) {
+      send(socket, '!', String(e));
+      socket.end();
+      return;
+    }
+    forward(worker.stdout, socket, 'o');
+    forward(worker.stderr, socket, 'e');
+    worker.on('close', (code) => {
+      send(socket, 'x', String(code === null ? 1 : code));
+      socket.end();
+    });
+    socket.on('close', () => {
+      if (worker.exitCode === null) {
+        worker.kill();
+      }
+    });
+    worker.stdin.end(JSON.stringify(job) + '\n');
+  }
+
+  const server = net.createServer((socket) => {
+    connections++;
+    clearTimeout(idleTimer);
+    let request = '';
+    socket.setEncoding('utf8');
+    socket.on('data', function onData(data) {
+      request += data;
+      const newline = request.indexOf('\n');
+      if (newline === -1) {
+        return;
+      }
+      socket.removeListener('data', onData);
+      let job;
+      try {
+        job = JSON.parse(request.slice(0, newline));
+      } catch (e) {
+        send(socket, '!', 'Bad request: ' + e);
+        socket.end();
+        return;
+      }
+      run(job, socket);
+    });
+    socket.on('error', () => {});
+    socket.on('close', () => {
+      connections--;
+      if (!connections) {
+        idleTimer = setTimeout(quit, IDLE_MS);
+      }
+    });
+  });
+
+  let retried = false;
+  server.on('error', (e) => {
+    if (e.code !== 'EADDRINUSE' || retried) {
+      process.exit(1);
+    }
+    retried = true;
+    // Take the socket over only if nothing is listening there anymore.
+    const probe = net.connect(address);
+    probe.on('connect', () => process.exit(0));
+    probe.on('error', () => {
+      try {
+        fs.unlinkSync(address);
+      } catch (e) {
+        // Someone else cleaned it up.
+      }
+      server.listen(address);
+    });
+  });
+  server.listen(address);
+  idleTimer = setTimeout(quit, IDLE_MS);
+  process.on('SIGTERM', quit);
+  // Nobody can reach us once the socket is gone, as when the temp dir is
+  // cleaned up.
+  setInterval(() => {
+    if (server.listening && !fs.existsSync(address)) {
+      quit();
+    }
+  }, CHECK_MS).unref();
+}
+
+// Send a frame: a tag, the length of the payload, and the payload. Return
+// whether the socket can take more right away.
+function send(socket, tag, payload) {
+  const data = Buffer.from(payload);
+  const header = Buffer.alloc(5);
+  header.write(tag, 0, 'latin1');
+  header.writeUInt32BE(data.length, 1);
+  socket.write(header);
+  return socket.write(data);
+}
+
+// Pass a stream of a worker along to the socket, as fast as it can take it.
+function forward(stream, socket, tag) {
+  stream.on('data', (data) => {
+    if (!send(socket, tag, data)) {
+      stream.pause();
+      socket.once('drain', () => stream.resume());
+    }
+  });
+}
+
+// Return the directory of the package a script is part of, or null.
+function packageOf(script) {
+  let directory = path.dirname(script);
+  while (!fs.existsSync(path.join(directory, 'package.json'))) {
+    const parent = path.dirname(directory);
+    if (parent === directory) {
+      return null;
+    }
+    directory = parent;
+  }
+  return directory;
+}
+
+function work(script) {
+  // Load everything the tool depends on, which is most of its startup time.
+  // Anything that won't load is left for the tool to deal with.
+  const directory = packageOf(script);
+  if (directory !== null) {
+    try {
+      const manifest = JSON.parse(fs.readFileSync(path.join(directory, 'package.json'), 'utf8'));
+      const modules = Object.keys(manifest.dependencies || {});
+      if (manifest.main) {
+        modules.push(path.resolve(directory, manifest.main));
+      }
+      for (const module of modules) {
+        try {
+          const resolved = require.resolve(module, {paths: [directory]});
+          // The tool's own script runs only once we know its arguments.
+          if (resolved !== script) {
+            require(resolved);
+          }
+        } catch (e) {
+          // Not loadable on its own
+        }
+      }
+    } catch (e) {
+      // No usable package.json
+    }
+  }
+
+  let input = '';
+  process.stdin.setEncoding('utf8');
+  process.stdin.on('data', (data) => {
+    input += data;
+  });
+  process.stdin.on('end', () => {
+    const job = JSON.parse(input);
+    for (const name of Object.keys(process.env)) {
+      delete process.env[name];
+    }
+    Object.assign(process.env, job.env);
+    process.chdir(job.cwd);
+    process.argv = [process.argv[0], job.script].concat(job.args);
+    Module.runMain();
+  });
+}
+
+if (process.argv[2] === '--worker') {
+  work(process.argv[3]);
+} else {
+  serve(process.argv[2]);
+}
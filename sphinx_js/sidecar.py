@@ -0,0 +1,231 @@
+"""Running JSDoc and TypeDoc in a long-lived helper process
+
+Starting node and loading all the modules of JSDoc or TypeDoc can take longer
+than the analysis itself, and it happens on every build, which adds up under
+sphinx-autobuild. When ``js_sidecar`` is on, we instead ask a helper,
+``sidecar.js``, to run the tool. The helper outlives builds and keeps a worker
+for each tool started ahead of time, with the tool's dependencies already
+loaded, so a run pays for little more than the analysis. Each worker runs one
+command and exits, so the tool sees a fresh process, as usual.
+
+The helper listens on a Unix socket only the user can reach, and it quits
+after sitting idle for a while. We speak to it like this: we send a line of
+JSON describing the command, and it sends back frames, each a tag byte, a
+4-byte big-endian length, and a payload. The tags are:
+
+* ``o``: some of the command's stdout
+* ``e``: some of its stderr
+* ``x``: its exit status, last
+* ``!``: an error which kept the helper from running it
+
+If the helper can't be started or reached, or it dies partway, the caller
+runs the command the ordinary way instead.
+
+"""
+import io
+from json import dumps
+import os
+from os.path import dirname, join, realpath
+import socket
+from shutil import which
+from stat import S_ISDIR
+import subprocess
+import sys
+from tempfile import gettempdir
+from time import sleep
+
+from .analyzer_utils import program_name_on_this_platform
+
+
+#: Bump this when the protocol changes so old helpers are left alone.
+SIDECAR_PROTOCOL = 1
+
+#: How long to wait for a newly started helper to listen, in seconds
+STARTUP_TIMEOUT = 5
+
+
+class SidecarUnavailable(Exception):
+    """The helper couldn't run a command, so it should be run some other
+    way."""
+
+
+def sidecar_address():
+    """Return the path of the helper's socket, or None if we can't have one
+    here.
+
+    It goes in a directory of the temp dir which belongs to and is reachable
+    by only the current user, so nobody else can impersonate the helper.
+
+    """
+    if not hasattr(socket, 'AF_UNIX') or os.name == 'nt':
+        return None
+    directory = join(gettempdir(), 'sphinx-js-%d' % os.getuid())
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    info = os.lstat(directory)
+    if (not S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or
+            info.st_mode & 0o077):
+        return None
+    return join(directory, 'sidecar-%d.sock' % SIDECAR_PROTOCOL)
+
+
+def run_in_sidecar(address, command, cwd=None, consume=None):
+    """Run a :class:`~sphinx_js.analyzer_utils.Command` in the helper,
+    starting the helper if need be.
+
+    Pass the command's stderr along to ours. If ``consume`` is given, return
+    what it returns when called with a binary stream of the command's stdout.
+    Otherwise, pass its stdout along to ours as well.
+
+    If the helper can't run the command to completion, raise
+    SidecarUnavailable.
+
+    """
+    script = _node_script(command.program)
+    connection = _connect(address)
+    output = _Output(connection)
+    try:
+        request = dict(script=script,
+                       args=command.args,
+                       cwd=cwd or os.getcwd(),
+                       env=dict(os.environ))
+        try:
+            connection.sendall(dumps(request).encode('utf-8') + b'\n')
+        except OSError as exc:
+            raise SidecarUnavailable(str(exc))
+        if consume is None:
+            output.finish(sys.stdout)
+            return None
+        result = consume(io.BufferedReader(output, 1 << 16))
+        output.finish()
+        return result
+    finally:
+        output.disconnect()
+        connection.close()
+
+
+def _node_script(program):
+    """Return the real path of the node script behind a command-line
+    program, like ``jsdoc``."""
+    executable = which(program_name_on_this_platform(program))
+    if not executable:
+        raise SidecarUnavailable('%s was not found.' % program)
+    script = realpath(executable)
+    try:
+        with open(script, 'rb') as f:
+            shebang = f.readline()
+    except OSError as exc:
+        raise SidecarUnavailable(str(exc))
+    if not (shebang.startswith(b'#!') and b'node' in shebang):
+        raise SidecarUnavailable('%s is not a node script.' % script)
+    return script
+
+
+def _connect(address):
+    """Return a socket connected to the helper, starting it if it isn't
+    running."""
+    try:
+        return _connected(address)
+    except OSError:
+        pass
+    node = which(program_name_on_this_platform('node'))
+    if not node:
+        raise SidecarUnavailable('node was not found.')
+    # Start it in its own session, so it outlives this build and isn't
+    # interrupted along with it.
+    subprocess.Popen([node, join(dirname(__file__), 'sidecar.js'), address],
+                     stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    waited = 0
+    while True:
+        try:
+            return _connected(address)
+        except OSError as exc:
+            if waited >= STARTUP_TIMEOUT:
+                raise SidecarUnavailable(str(exc))
+        sleep(0.05)
+        waited += 0.05
+
+
+def _connected(address):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+class _Output(io.RawIOBase):
+    """The stdout of a command run by the helper, read from its frames"""
+
+    def __init__(self, connection):
+        self._file = connection.makefile('rb')
+        self._chunk = memoryview(b'')
+        #: The exit status of the command, once it has finished
+        self.status = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            if self.status is not None:
+                return 0
+            self._next_frame()
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def _next_frame(self):
+        header = self._read(5)
+        tag, size = header[:1], int.from_bytes(header[1:], 'big')
+        payload = self._read(size)
+        if tag == b'o':
+            self._chunk = memoryview(payload)
+        elif tag == b'e':
+            _write(sys.stderr, payload)
+        elif tag == b'x':
+            self.status = int(payload)
+        else:
+            raise SidecarUnavailable(payload.decode('utf-8', 'replace'))
+
+    def _read(self, size):
+        try:
+            data = self._file.read(size)
+        except OSError as exc:
+            raise SidecarUnavailable(str(exc))
+        if len(data) < size:
+            raise SidecarUnavailable('The helper went away.')
+        return data
+
+    def finish(self, stdout=None):
+        """Read the rest of the frames, through the exit status, writing any
+        more stdout to a stream if one is given."""
+        while self.status is None:
+            self._next_frame()
+            if stdout is not None and self._chunk:
+                _write(stdout, self._chunk)
+            self._chunk = memoryview(b'')
+
+    def disconnect(self):
+        self._file.close()
+
+
+def _write(stream, data):
+    """Write some bytes to a text stream, like stdout."""
+    stream.flush()
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is None:
+        stream.write(bytes(data).decode('utf-8', 'replace'))
+    else:
+        buffer.write(data)
+        buffer.flush()
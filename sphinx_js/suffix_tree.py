@@ -1,18 +1,69 @@
+from sys import getsizeof
+
+
+class _NoValue:
+    """Marker for nodes that hold no value, since None is a fine value"""
+    def __repr__(self):
+        return '<no value>'
+
+    def __reduce__(self):
+        # Unpickle to the same singleton, so identity checks keep working.
+        return '_NO_VALUE'
+_NO_VALUE = _NoValue()
+
+#: Kinds of outcome recorded in a SuffixTree's index
+_FOUND = 'found'
+_AMBIGUOUS = 'ambiguous'
+
+
+class _Node:
+    """A node of a SuffixTree
+
+    Unary chains of valueless nodes are collapsed into the edge leading to the
+    node beneath them, so ``label`` is the (reversed) run of segments between
+    this node and its parent.
+
+    """
+    __slots__ = ('label', 'value', 'children')
+
+    def __init__(self, label, value=_NO_VALUE, children=None):
+        #: Tuple of segments leading here from the parent, in walking order
+        self.label = label
+        self.value = value
+        #: None or a dict mapping the first segment of each child's label to
+        #: the child. Never empty.
+        self.children = children
+
+    def __reduce__(self):
+        # Much faster to pickle and unpickle than the default for slots
+        return _Node, (self.label, self.value, self.children)
+
+
 class SuffixTree(object):
     """A suffix tree in which you can use anything hashable as a path segment
     and anything at all as a value
 
     """
     def __init__(self):
-        #: Internal structure is like... ::
-        #:
-        #:     Tree = {value?: Any,
-        #:             subtree?: {segmentFoo: Tree, segmentBar: Tree, ...}}
-        #
-        #: A Tree can have a value key, a subtree key, or both. Subtree dicts
-        #: always have at least 1 key. Every subtree has at least one value,
-        #: directly or indirectly. ``self._tree`` itself is a Tree.
-        self._tree = {}
+        #: The tree is made of _Nodes, walked from the last segment of a path
+        #: toward the first. Every node except the root has a value, more than
+        #: one child, or both. Every subtree has at least one value, directly
+        #: or indirectly.
+        self._root = _Node(())
+        #: One canonical instance of each segment, so the hundreds of
+        #: thousands of paths from a big project don't each keep their own
+        #: copies of "./", "prototype.", and so on
+        self._segments = {}
+        #: Optional map of suffix tuples to the outcomes of looking them up.
+        #: See build_index().
+        self._index = None
+        #: The longest suffix in the index, or None if it has all of them
+        self._max_indexed_length = None
+
+    def _interned(self, segments):
+        """Return a reversed, interned tuple of the given segments."""
+        segments = list(reversed(segments))
+        return tuple(map(self._segments.setdefault, segments, segments))
 
     def add(self, unambiguous_segments, value):
         """Add an item to the tree.
@@ -22,13 +73,30 @@ class SuffixTree(object):
         :arg value: Any value you want to fetch by path
 
         """
-        tree = self._tree
-        for seg in reversed(unambiguous_segments):
-            tree = tree.setdefault('subtree', {}).setdefault(seg, {})
-        if 'value' in tree:
+        self._index = None
+        key = self._interned(unambiguous_segments)
+        node = self._root
+        i = 0
+        while i < len(key):
+            child = node.children and node.children.get(key[i])
+            if not child:
+                if node.children is None:
+                    node.children = {}
+                node.children[key[i]] = _Node(key[i:], value)
+                return
+            label = child.label
+            common = _common_prefix_length(label, key, i)
+            if common < len(label):
+                # Split the edge, putting a new node where the paths diverge:
+                middle = _Node(label[:common], children={label[common]: child})
+                child.label = label[common:]
+                node.children[key[i]] = middle
+                child = middle
+            node = child
+            i += common
+        if node.value is not _NO_VALUE:
             raise PathTaken(unambiguous_segments)
-        else:
-            tree['value'] = value
+        node.value = value
 
     def add_many(self, segments_and_values):
         """Add a batch of items to the tree all at once, and collect any
@@ -49,6 +117,48 @@ class SuffixTree(object):
         if conflicts:
             raise PathsTaken(conflicts)
 
+    def remove(self, unambiguous_segments):
+        """Remove an item from the tree.
+
+        :arg unambiguous_segments: The full list of path segments the item was
+            added under
+
+        If there is no item at exactly that path, raise SuffixNotFound.
+
+        """
+        self._index = None
+        key = tuple(reversed(unambiguous_segments))
+        ancestry = []  # Nodes from the root down to the parent of ``node``
+        node = self._root
+        i = 0
+        while i < len(key):
+            child = node.children and node.children.get(key[i])
+            if not child or key[i:i + len(child.label)] != child.label:
+                raise SuffixNotFound(unambiguous_segments)
+            ancestry.append(node)
+            node = child
+            i += len(child.label)
+        if node.value is _NO_VALUE:
+            raise SuffixNotFound(unambiguous_segments)
+        node.value = _NO_VALUE
+
+        # Restore the invariants: drop the node if it's now empty, and fold
+        # away any valueless node left with a single child.
+        if not ancestry:
+            return
+        parent = ancestry.pop()
+        if node.children is None:
+            del parent.children[node.label[0]]
+            if not parent.children:
+                parent.children = None
+            if not ancestry:
+                return
+            node, parent = parent, ancestry.pop()
+        if node.value is _NO_VALUE and node.children and len(node.children) == 1:
+            only_child = next(iter(node.children.values()))
+            only_child.label = node.label + only_child.label
+            parent.children[node.label[0]] = only_child
+
     def get_with_path(self, segments):
         """Return the value stored at a path ending in the given segments,
         along with the full path found.
@@ -62,44 +172,129 @@ class SuffixTree(object):
         assume the intention was to present a full path.
 
         """
-        # Keep walking down subtrees (returning NotFound if failed) until we
-        # run out of segs:
-        tree = self._tree
-        for seg in reversed(segments):
-            try:
-                tree = tree['subtree'][seg]
-            except KeyError:
+        if self._index is not None and (self._max_indexed_length is None or
+                                        len(segments) <= self._max_indexed_length):
+            outcome = self._index.get(tuple(segments))
+            if outcome is None:
                 raise SuffixNotFound(segments)
-
-        # If there's only a value there, return it:
-        if 'value' in tree:
-            if 'subtree' in tree:
-                raise SuffixAmbiguous(segments, list(tree['subtree'].keys()), or_ends_here=True)
-            return tree['value'], segments
-
-        # Else if there's a subtree, follow its 1-key subtrees forever, since
-        # there's no ambiguity there:
+            kind, value_or_keys, path_or_ends_here = outcome
+            if kind == _AMBIGUOUS:
+                raise SuffixAmbiguous(segments, list(value_or_keys), or_ends_here=path_or_ends_here)
+            return value_or_keys, list(path_or_ends_here)
+
+        # Keep walking down edges (returning NotFound if failed) until we run
+        # out of segs:
+        key = tuple(reversed(segments))
+        node = self._root
         additional_segments = []
-        while len(tree.get('subtree', {})) == 1:
-            only_key = next(iter(tree['subtree'].keys()))
-            tree = tree['subtree'][only_key]
-            additional_segments.append(only_key)
+        i = 0
+        while i < len(key):
+            child = node.children and node.children.get(key[i])
+            if not child:
+                raise SuffixNotFound(segments)
+            label = child.label
+            if key[i:i + len(label)] != label[:len(key) - i]:
+                raise SuffixNotFound(segments)
+            # If we ran out of segs partway down the edge, the rest of it is
+            # an unambiguous continuation:
+            additional_segments.extend(label[len(key) - i:])
+            node = child
+            i += len(label)
+
+        if not additional_segments and node.value is not _NO_VALUE:
+            # If there's only a value there, return it:
+            if node.children:
+                raise SuffixAmbiguous(segments, list(node.children.keys()), or_ends_here=True)
+            return node.value, segments
+
+        # Else follow 1-child nodes forever, since there's no ambiguity there.
+        # (Like the original dict-based implementation, this passes over any
+        # values along the way.)
+        while node.children and len(node.children) == 1:
+            node = next(iter(node.children.values()))
+            additional_segments.extend(node.label)
 
         # If we arrived at a spot with multiple possiblities, yell:
-        if len(tree.get('subtree', {})) > 1:
-            raise SuffixAmbiguous(segments, list(tree['subtree'].keys()))
+        if node.children:
+            raise SuffixAmbiguous(segments, list(node.children.keys()))
 
-        # Otherwise, return the found value. There must always be a value here
-        # because add() always eventually adds (or finds) a value after a chain
-        # of subtrees. If there were multiple subtrees from here, we would have
-        # raised SuffixAmbiguous above. If there were a single one, we would
-        # have followed it. So, since subtrees always eventually terminate in a
-        # value, we must be at one now.
-        return tree['value'], (list(reversed(additional_segments)) + segments)
+        # Otherwise, return the found value. There must always be a value here,
+        # because every leaf has one, unless the tree is empty.
+        if node.value is _NO_VALUE:
+            raise SuffixNotFound(segments)
+        return node.value, (list(reversed(additional_segments)) + segments)
 
     def get(self, segments):
         return self.get_with_path(segments)[0]
 
+    def build_index(self, max_suffix_length=None):
+        """Work out ahead of time what looking up each suffix in the tree
+        would do, so get_with_path() can answer with a single hash probe.
+
+        Ambiguous suffixes are indexed along with their candidate keys, so the
+        exceptions raised are just as informative. Adding or removing an item
+        throws the index away.
+
+        :arg max_suffix_length: If given, index only suffixes of at most this
+            many segments, to bound the memory used. Longer ones are looked up
+            by walking the tree as usual.
+        :return: The number of suffixes indexed and a rough count of the bytes
+            the index takes up, not counting the segments and values it shares
+            with the tree
+        """
+        index = {}
+
+        def index_subtree(node, walked):
+            """Index the positions in and under a node, and return the outcome
+            of following single-child chains down from it.
+
+            :arg walked: The reversed path from the root to the node
+            """
+            children = node.children or {}
+            chains = {head: index_subtree(child, walked + child.label)
+                      for head, child in children.items()}
+            if not children:
+                chain = (_FOUND, node.value, walked[::-1])
+            elif len(children) == 1:
+                chain = next(iter(chains.values()))
+            else:
+                chain = (_AMBIGUOUS, tuple(children), False)
+            if node.value is not _NO_VALUE and children:
+                ends_here = (_AMBIGUOUS, tuple(children), True)
+            else:
+                ends_here = chain
+            if max_suffix_length is None or len(walked) <= max_suffix_length:
+                index[walked[::-1]] = ends_here
+            # Stopping partway down an edge is like stopping at a valueless
+            # node with one child:
+            for head, child in children.items():
+                for length in range(1, len(child.label)):
+                    if max_suffix_length is not None and len(walked) + length > max_suffix_length:
+                        break
+                    index[(walked + child.label[:length])[::-1]] = chains[head]
+            return chain
+
+        if self._root.children is not None or self._root.value is not _NO_VALUE:
+            index_subtree(self._root, ())
+        self._index = index
+        self._max_indexed_length = max_suffix_length
+
+        size = getsizeof(index) + sum(getsizeof(suffix) for suffix in index)
+        outcomes = {id(outcome): outcome for outcome in index.values()}
+        size += sum(getsizeof(outcome) + getsizeof(outcome[1] if outcome[0] == _AMBIGUOUS else outcome[2])
+                    for outcome in outcomes.values())
+        return len(index), size
+
+
+def _common_prefix_length(label, key, start):
+    """Return how many items of ``label`` match ``key`` from index ``start``
+    on."""
+    length = min(len(label), len(key) - start)
+    for i in range(length):
+        if label[i] != key[start + i]:
+            return i
+    return length
+
 
 class SuffixError(Exception):
     def __init__(self, segments):
@@ -1,44 +1,106 @@
 """Converter from TypeDoc output to IR format"""
 
 from codecs import getreader
+from concurrent.futures import ThreadPoolExecutor
 from errno import ENOENT
 from json import load
-from os.path import basename, join, normpath, relpath, sep, splitext
-from platform import node
+import marshal
+from os import walk
+from os.path import basename, isfile, join, normpath, relpath, sep, splitext
 import re
 import subprocess
+from sys import intern
 from tempfile import NamedTemporaryFile
-from typing import Iterator, List, Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 from sphinx.errors import SphinxError
 
-from .analyzer_utils import Command, is_explicitly_rooted
+from .analyzer_utils import (cache_to_file, Command, file_digest, IrCache,
+                             is_explicitly_rooted, parallel_jobs, tool_version)
 from .ir import Attribute, Class, Function, Interface, NO_DEFAULT, Param, Pathname, Return, TopLevel
+from .sidecar import run_in_sidecar, sidecar_address, SidecarUnavailable
 from .suffix_tree import SuffixTree
 
 
 class Analyzer:
-    def __init__(self, json, base_dir):
+    def __init__(self, json, base_dir, lazy=False):
         """
         :arg json: The loaded JSON output from typedoc
         :arg base_dir: The absolute path of the dir relative to which to
             construct file-path segments of object paths
+        :arg lazy: Whether to index only the paths of nodes up front and
+            convert them to IR objects as they're asked for. Otherwise, convert
+            them all now and drop the JSON.
 
         """
         self._base_dir = base_dir
+        self._lazy = lazy
+        # Leave out the nodes we never document, like the many from type
+        # packages, so they don't take up room in the indices:
+        json, foreign = without_foreign_nodes(json)
         self._index = index_by_id({}, json)
-        ir_objects = self._convert_all_nodes(json)
-        # Toss this overboard to save RAM. We're done with it now:
-        del self._index
+        # The function, constructor, or method each signature belongs to, by
+        # ID. Nothing else needs its parent.
+        self._signature_owners = {sig['id']: node
+                                  for node in self._index.values()
+                                  for sig in node.get('signatures', [])}
+        # Descriptions of types, memoized by _type_name():
+        self._type_names = {}
+        # The path, containing module, and deppath of each node, by ID:
+        self._contexts = {node['id']: context
+                          for node, context in path_contexts(json, base_dir)
+                          if 'id' in node}
+        if foreign:
+            self._add_stubs(foreign, referenced_ids(json))
+        # IR objects converted so far, by node ID, so class members and things
+        # documented in several places are converted only once. Its bounds can
+        # be changed by replacing it.
+        self.ir_cache = IrCache()
         self._objects_by_path = SuffixTree()
-        self._objects_by_path.add_many((obj.path.segments, obj) for obj in ir_objects)
+        if lazy:
+            # Keep the JSON, reachable through the index, for converting later:
+            self._objects_by_path.add_many(
+                (self._contexts[node['id']].segments, node)
+                for node in convertible_nodes(json))
+        else:
+            ir_objects = self._convert_all_nodes(json)
+            # Toss these overboard to save RAM. We're done with them now:
+            del self._index
+            del self._signature_owners
+            del self._contexts
+            del self._type_names
+            self.ir_cache.clear()
+            self._objects_by_path.add_many((obj.path.segments, obj) for obj in ir_objects)
 
     @classmethod
     def from_disk(cls, abs_source_paths, app, base_dir):
-        json = typedoc_output(abs_source_paths,
+        json = typedoc_output(app.config.typedoc_cache,
+                              abs_source_paths,
                               app.confdir,
-                              app.config.jsdoc_config_path)
-        return cls(json, base_dir)
+                              app.config.jsdoc_config_path,
+                              parallel_jobs(app.config.typedoc_parallel_jobs),
+                              app.config.js_sidecar and sidecar_address())
+        return cls(json, base_dir, lazy=app.config.typedoc_lazy)
+
+    @classmethod
+    def cache_inputs(cls, abs_source_paths, app, base_dir):
+        """Return everything that can change an analyzer made by
+        ``from_disk()``, in the form ``snapshotted()`` expects."""
+        source_files, settings = _typedoc_cache_inputs(
+            None,
+            abs_source_paths,
+            app.confdir,
+            app.config.jsdoc_config_path,
+            parallel_jobs(app.config.typedoc_parallel_jobs))
+        return source_files, dict(settings,
+                                  analyzer='typedoc',
+                                  base_dir=base_dir,
+                                  lazy=app.config.typedoc_lazy)
+
+    def update_from_disk(self, stale, manifest, app):
+        """Return None, since TypeDoc can't usefully analyze changed files on
+        their own. The caller will start over."""
+        return None
 
     def get_object(self, path_suffix, as_type=None):
         """Return the IR object with the given path suffix.
@@ -54,52 +116,32 @@ class Analyzer:
         important in the future: that's how TypeDoc points to superclass
         definitions of methods inherited by subclasses.)
 
-        """
-        return self._objects_by_path.get(path_suffix)
-
-    def _parent_nodes(self, node) -> Iterator[node]:
-        """Return an iterator of parent nodes"""
-        while True:
-            node = node.get('__parent')
-            if not node or node['id'] == 0:
-                # We went all the way up but didn't find a containing module.
-                return
-            elif node.get('kindString') == 'External module':
-                # Found one!
-                yield node
-
-    def _containing_module(self, node) -> Optional[Pathname]:
-        """Return the Pathname pointing to the module containing the given
-        node, None if one isn't found."""
-        for node in self._parent_nodes(node):
-            return Pathname(make_path_segments(node, self._base_dir))
-        return None
-
-    def _containing_deppath(self, node) -> Optional[Pathname]:
-        """Return the path pointing to the module containing the given node.
-        The path is absolute or relative to `root_for_relative_js_paths`.
-        Raises ValueError if one isn't found.
+        In lazy mode, only that traversal is eager. The nodes are converted
+        when they're asked for.
 
         """
-        for node in self._parent_nodes(node):
-            deppath = node.get('originalName')
-            if deppath:
-                return relpath(deppath, self._base_dir)
-            else:
-                raise ValueError('Could not find deppath')
-        raise ValueError('Could not find deppath')
+        found = self._objects_by_path.get(path_suffix)
+        return self._converted(found) if self._lazy else found
+
+    def index_suffixes(self, max_suffix_length=None):
+        """Precompute path-suffix lookups. See SuffixTree.build_index()."""
+        return self._objects_by_path.build_index(max_suffix_length)
 
     def _top_level_properties(self, node):
-        source = node.get('sources')[0]
-        if node.get('flags', {}).get('isExported', False):
-            exported_from = self._containing_module(node)
-        else:
-            exported_from = None
+        source = self._sources(node)[0]
+        context = self._contexts[node['id']]
+        if context.module is None:
+            raise ValueError('Could not find deppath')
+        module_path, deppath = context.module
+        if deppath is None:
+            raise ValueError('Could not find deppath')
         return dict(
             name=short_name(node),
-            path=Pathname(make_path_segments(node, self._base_dir)),
+            path=Pathname(context.segments),
             filename=basename(source['fileName']),
-            deppath=self._containing_deppath(node),
+            # The path pointing to the module containing the node, absolute or
+            # relative to `root_for_relative_js_paths`:
+            deppath=deppath,
             description=make_description(node.get('comment', {})),
             line=source['line'],
 
@@ -109,7 +151,37 @@ class Analyzer:
             see_alsos=[],
             properties=[],
 
-            exported_from=exported_from)
+            exported_from=(module_path
+                           if node.get('flags', {}).get('isExported', False)
+                           else None))
+
+    def _add_stubs(self, foreign, ids):
+        """Index stand-ins for the nodes among some left-out ones that have
+        the given IDs, holding just enough for types and superclasses that
+        refer to them.
+
+        :arg foreign: A list of (left-out node, parent) pairs, as from
+            ``without_foreign_nodes()``
+
+        """
+        for node, parent in foreign:
+            for node, context in path_contexts(node,
+                                               self._base_dir,
+                                               parent,
+                                               self._contexts[parent['id']]):
+                id = node.get('id')
+                if id in ids and id not in self._index:
+                    self._index[id] = {'id': id,
+                                       'name': node['name'],
+                                       'kindString': node.get('kindString')}
+                    self._contexts[id] = context
+
+    def _sources(self, node):
+        """Return the list of places a node is defined. Those of a signature
+        are the ones of the function, constructor, or method it belongs to."""
+        if node.get('kindString') in ['Call signature', 'Constructor signature']:
+            node = self._signature_owners[node['id']]
+        return node.get('sources')
 
     def _constructor_and_members(self, cls) -> Tuple[Optional[Function], List[Union[Function, Attribute]]]:
         """Return the constructor and other members of a class.
@@ -126,7 +198,7 @@ class Analyzer:
         constructor = None
         members = []
         for child in cls.get('children', []):
-            ir, _ = self._convert_node(child)
+            ir = self._converted(child)
             if ir:
                 if (child.get('kindString') == 'Constructor'):
                     # This really, really should happen exactly once per class.
@@ -136,14 +208,15 @@ class Analyzer:
         return constructor, members
 
     def _convert_all_nodes(self, root):
-        todo = [root]
-        done = []
-        while todo:
-            converted, more_todo = self._convert_node(todo.pop())
-            if converted:
-                done.append(converted)
-            todo.extend(more_todo)
-        return done
+        return [ir for ir in map(self._converted, convertible_nodes(root)) if ir]
+
+    def _converted(self, node) -> Optional[TopLevel]:
+        """Return the IR object a node converts to, converting it only if it
+        hasn't been already."""
+        node, _ = convertible_node(node)
+        if node is None:
+            return None
+        return self.ir_cache.get(node['id'], lambda: self._convert_node(node)[0])
 
     def _convert_node(self, node) -> Tuple[TopLevel, List[dict]]:
         """Convert a node of TypeScript JSON output to an IR object.
@@ -154,24 +227,13 @@ class Analyzer:
             are omitted.
 
         """
-        if node.get('inheritedFrom'):
-            return None, []
-        if node.get('sources'):
-            # Ignore nodes with a reference to absolute paths (like /usr/lib)
-            source = node.get('sources')[0]
-            if source.get('fileName', '.')[0] == '/':
-                return None, []
+        node, children = convertible_node(node)
+        if node is None:
+            return None, children
 
         ir = None
         kind = node.get('kindString')
-        if kind == 'External module':
-            # We shouldn't need these until we implement automodule. But what
-            # of js:mod in the templates?
-            pass
-        elif kind == 'Module':
-            # Does anybody even use TS's old internal modules anymore?
-            pass
-        elif kind == 'Interface':
+        if kind == 'Interface':
             _, members = self._constructor_and_members(node)
             ir = Interface(
                 members=members,
@@ -206,18 +268,6 @@ class Analyzer:
                 type=self._type_name(type),
                 **member_properties(node),
                 **self._top_level_properties(node))
-        elif kind in ['Function', 'Constructor', 'Method']:
-            # There's really nothing in these; all the interesting bits are in
-            # the contained 'Call signature' keys. We support only the first
-            # signature at the moment, because to do otherwise would create
-            # multiple identical pathnames to the same function, which would
-            # cause the suffix tree to raise an exception while being built. An
-            # eventual solution might be to store the signatures in a one-to-
-            # many attr of Functions.
-            sigs = node.get('signatures')
-            first_sig = sigs[0]  # Should always have at least one
-            first_sig['sources'] = node['sources']
-            return self._convert_node(first_sig)
         elif kind in ['Call signature', 'Constructor signature']:
             # This is the real meat of a function, method, or constructor.
             #
@@ -232,10 +282,10 @@ class Analyzer:
                 # Though perhaps technically true, it looks weird to the user
                 # (and in the template) if constructors have a return value:
                 returns=self._make_returns(node) if kind != 'Constructor signature' else [],
-                **member_properties(node['__parent']),
+                **member_properties(self._signature_owners[node['id']]),
                 **self._top_level_properties(node))
 
-        return ir, node.get('children', [])
+        return ir, children
 
     def _related_types(self, node, kind):
         """Return the unambiguous pathnames of implemented interfaces or
@@ -251,18 +301,35 @@ class Analyzer:
         types = []
         for type in node.get(kind, []):
             if type['type'] == 'reference':
-                pathname = Pathname(make_path_segments(self._index[type['id']],
-                                                       self._base_dir))
-                types.append(pathname)
+                types.append(Pathname(self._contexts[type['id']].segments))
             # else it's some other thing we should go implement
         return types
 
     def _type_name(self, type):
         """Return a string description of a type.
 
+        The same types turn up on many params and properties. Descriptions of
+        compound ones, like unions and generics, are memoized by structure, and
+        all are interned so equal ones share one string.
+
         :arg type: A TypeDoc-emitted type node
 
         """
+        if not (type.get('type') in COMPOUND_TYPES or
+                type.get('typeArguments') or
+                type.get('constraint')):
+            # It's a single lookup at most: cheaper to do than to memoize.
+            return intern(self._render_type_name(type))
+        # Marshaling is much faster than rendering, and equal serializations
+        # mean equal types:
+        key = marshal.dumps(type)
+        name = self._type_names.get(key)
+        if name is None:
+            name = self._type_names[key] = intern(self._render_type_name(type))
+        return name
+
+    def _render_type_name(self, type):
+        """Return a string description of a type, without memoizing."""
         type_of_type = type.get('type')
 
         if type_of_type == 'reference' and type.get('id'):
@@ -280,22 +347,22 @@ class Analyzer:
         elif type_of_type == 'stringLiteral':
             name = '"' + type['value'] + '"'
         elif type_of_type == 'array':
-            name = self._type_name(type['elementType']) + '[]'
+            name = self._render_type_name(type['elementType']) + '[]'
         elif type_of_type == 'tuple' and type.get('elements'):
-            types = [self._type_name(t) for t in type['elements']]
+            types = [self._render_type_name(t) for t in type['elements']]
             name = '[' + ', '.join(types) + ']'
         elif type_of_type == 'union':
-            name = '|'.join(self._type_name(t) for t in type['types'])
+            name = '|'.join(self._render_type_name(t) for t in type['types'])
         elif type_of_type == 'intersection':
-            name = ' & '.join(self._type_name(t) for t in type['types'])
+            name = ' & '.join(self._render_type_name(t) for t in type['types'])
         elif type_of_type == 'typeOperator':
-            name = type['operator'] + ' ' + self._type_name(type['target'])
+            name = type['operator'] + ' ' + self._render_type_name(type['target'])
             # e.g. "keyof T"
         elif type_of_type == 'typeParameter':
             name = type['name']
             constraint = type.get('constraint')
             if constraint is not None:
-                name += ' extends ' + self._type_name(constraint)
+                name += ' extends ' + self._render_type_name(constraint)
                 # e.g. K += extends + keyof T
         elif type_of_type == 'reflection':
             name = '<TODO: reflection>'
@@ -305,7 +372,7 @@ class Analyzer:
 
         type_args = type.get('typeArguments')
         if type_args:
-            arg_names = ', '.join(self._type_name(arg) for arg in type_args)
+            arg_names = ', '.join(self._render_type_name(arg) for arg in type_args)
             name += f'<{arg_names}>'
 
         return name
@@ -340,55 +407,329 @@ class Analyzer:
             description=signature.get('comment', {}).get('returns', '').strip())]
 
 
-def typedoc_output(abs_source_paths, sphinx_conf_dir, config_path):
+#: Kinds of types made of other types, whose descriptions are worth memoizing
+COMPOUND_TYPES = {'array', 'tuple', 'union', 'intersection', 'typeOperator'}
+
+
+def _typedoc_cache_inputs(cache, abs_source_paths, sphinx_conf_dir, config_path=None, jobs=1, sidecar=None):
+    """Return everything that can change the output of ``typedoc_output()``,
+    in the form ``cache_to_file()`` expects."""
+    config_file = normpath(join(sphinx_conf_dir, config_path)) if config_path else None
+    return (typedoc_source_files(abs_source_paths),
+            dict(tool='typedoc',
+                 version=tool_version('typedoc'),
+                 source_paths=abs_source_paths,
+                 conf_dir=str(sphinx_conf_dir),
+                 config=config_file and file_digest(config_file),
+                 per_entry_point=_runs_per_entry_point(abs_source_paths, jobs)))
+
+
+def _runs_per_entry_point(abs_source_paths, jobs):
+    return jobs > 1 and len(abs_source_paths) > 1
+
+
+@cache_to_file(lambda cache, *args, **kwargs: cache, _typedoc_cache_inputs)
+def typedoc_output(cache, abs_source_paths, sphinx_conf_dir, config_path=None, jobs=1, sidecar=None):
     """Return the loaded JSON output of the TypeDoc command run over the given
-    paths."""
+    paths.
+
+    :arg cache: The path of a file in which to keep the output and reuse it
+        until the inputs change, or None not to
+    :arg jobs: The number of TypeDoc processes to run at once. If more than
+        1, each of the paths is run separately as an entry point, and the
+        outputs are merged into one tree.
+    :arg sidecar: The address of a helper to run TypeDoc in, as from
+        ``sidecar_address()``, or None to start TypeDoc ourselves
+
+    """
+    if _runs_per_entry_point(abs_source_paths, jobs):
+        with ThreadPoolExecutor(min(jobs, len(abs_source_paths))) as pool:
+            outputs = list(pool.map(
+                lambda path: _run_typedoc([path], sphinx_conf_dir, config_path, sidecar),
+                abs_source_paths))
+        return merge_typedoc_outputs(outputs)
+    return _run_typedoc(abs_source_paths, sphinx_conf_dir, config_path, sidecar)
+
+
+def _run_typedoc(abs_source_paths, sphinx_conf_dir, config_path, sidecar=None):
     command = Command('typedoc')
     if config_path:
         command.add('--tsconfig', normpath(join(sphinx_conf_dir, config_path)))
 
     with NamedTemporaryFile(mode='w+b') as temp:
         command.add('--json', temp.name, *abs_source_paths)
-        try:
-            subprocess.call(command.make())
-        except OSError as exc:
-            if exc.errno == ENOENT:
-                raise SphinxError('%s was not found. Install it using "npm install -g typedoc".' % command.program)
-            else:
-                raise
+        ran = False
+        if sidecar:
+            try:
+                run_in_sidecar(sidecar, command)
+                ran = True
+            except SidecarUnavailable:
+                pass  # Start TypeDoc ourselves.
+        if not ran:
+            try:
+                subprocess.call(command.make())
+            except OSError as exc:
+                if exc.errno == ENOENT:
+                    raise SphinxError('%s was not found. Install it using "npm install -g typedoc".' % command.program)
+                else:
+                    raise
         # typedoc emits a valid JSON file even if it finds no TS files in the dir:
         return load(getreader('utf-8')(temp))
 
 
-def index_by_id(index, node, parent=None):
+def merge_typedoc_outputs(outputs):
+    """Combine the outputs of TypeDoc runs over separate entry points into
+    one tree, like that of a single run.
+
+    Each run numbers its nodes from 0, so we renumber them into one space,
+    along with the IDs they're referred to by, as from types, superclasses,
+    and groups. A module more than one run took in, like one imported by
+    several entry points, is kept from the first only, and references to the
+    other runs' copies of its nodes are pointed at the kept ones.
+
+    Changes the outputs.
+
+    """
+    merged = None
+    modules = {}  # originalName: the kept External module node
+    next_id = 1  # 0 is the root.
+    for output in outputs:
+        if merged is None:
+            merged = dict(output, id=0, children=[], groups=[])
+        # This run's IDs, mapped to the merged ones:
+        ids = {output.get('id', 0): 0}
+        kept = []
+        for child in output.get('children', []):
+            twin = (modules.get(child.get('originalName'))
+                    if child.get('kindString') == 'External module'
+                    else None)
+            if twin is None:
+                if child.get('kindString') == 'External module':
+                    modules[child.get('originalName')] = child
+                kept.append(child)
+                for node in _json_dicts(child):
+                    if 'id' in node and node.get('type') != 'reference':
+                        ids[node['id']] = next_id
+                        next_id += 1
+            else:
+                _match_ids(child, twin, ids)
+        for child in kept:
+            for node in _json_dicts(child):
+                if 'id' in node:
+                    id = ids.get(node['id'])
+                    if id is None:
+                        # A reference to something TypeDoc didn't emit. Keep
+                        # it from colliding with anything.
+                        id = ids[node['id']] = next_id
+                        next_id += 1
+                    node['id'] = id
+                for group in node.get('groups', []):
+                    group['children'] = [ids.get(id, id) for id in group.get('children', [])]
+        merged['children'].extend(kept)
+        groups = {group['title']: group for group in merged['groups']}
+        for group in output.get('groups', []):
+            children = [ids[id] for id in group.get('children', []) if id in ids]
+            if group['title'] in groups:
+                # Leave out the modules already listed from an earlier run:
+                existing = groups[group['title']]['children']
+                seen = set(existing)
+                existing.extend(id for id in children if id not in seen)
+            else:
+                merged['groups'].append(dict(group, children=children))
+    return merged
+
+
+def _json_dicts(value):
+    """Return an iterable of all the dicts within some JSON, inclusive."""
+    todo = [value]
+    while todo:
+        value = todo.pop()
+        if type(value) is dict:
+            yield value
+            todo.extend(value.values())
+        elif type(value) is list:
+            todo.extend(value)
+
+
+def _match_ids(node, twin, ids):
+    """Map the IDs of the nodes within a node to those of the corresponding
+    nodes within its twin from another TypeDoc run."""
+    todo = [(node, twin)]
+    while todo:
+        node, twin = todo.pop()
+        if 'id' in node and 'id' in twin:
+            ids[node['id']] = twin['id']
+        twin_children = {(child.get('kindString'), child.get('name')): child
+                         for child in twin.get('children', [])}
+        for child in node.get('children', []):
+            twin_child = twin_children.get((child.get('kindString'), child.get('name')))
+            if twin_child is not None:
+                todo.append((child, twin_child))
+        for tag in ['signatures', 'parameters']:
+            todo.extend(zip(node.get(tag, []), twin.get(tag, [])))
+
+
+#: Extensions of the files TypeDoc reads when given a directory
+TYPESCRIPT_EXTENSIONS = ('.ts', '.tsx', '.mts', '.cts')
+
+
+def typedoc_source_files(abs_source_paths):
+    """Return the sorted absolute paths of the TypeScript files under some
+    paths, skipping dependencies and hidden dirs.
+
+    This is what TypeDoc reads when given those paths, unless a tsconfig file
+    says otherwise.
+
+    """
+    files = set()
+    for path in abs_source_paths:
+        if isfile(path):
+            files.add(path)
+            continue
+        for dirpath, dirnames, filenames in walk(path):
+            dirnames[:] = [d for d in dirnames
+                           if d != 'node_modules' and not d.startswith('.')]
+            files.update(join(dirpath, f) for f in filenames
+                         if f.endswith(TYPESCRIPT_EXTENSIONS))
+    return sorted(files)
+
+
+def index_by_id(index, root, parents=None):
     """Create an ID-to-node mapping for all the TypeDoc output nodes.
 
-    We don't unnest them, but we do add ``__parent`` keys so we can easily walk
-    both up and down.
+    We don't unnest them or otherwise change them. If asked, we note the
+    parent of each node in a separate mapping so we can easily walk both up
+    and down.
 
     :arg index: The mapping to add keys to as we go
-    :arg node: The node to start traversing down from
-    :arg parent: The parent node of ``node``
+    :arg root: The node to start traversing down from
+    :arg parents: A mapping to which to add the ID of each node, pointing to
+        its parent node (None for ``root``), or None not to bother
 
     """
-    # TODO: Can we just uniformly set __parent on nodes rather than doing it
-    # differently in different cases? I think the reason for the cases is that
-    # we used to set a parent ID rather than a parent pointer and not all nodes
-    # have IDs.
-    if node is not None:
+    todo = [(root, None)]
+    while todo:
+        node, parent = todo.pop()
+        if node is None:
+            continue
         id = node.get('id')
         if id is not None:  # 0 is okay; it's the root node.
-            # Give anything in the map a parent:
-            node['__parent'] = parent  # Parents are used for (1) building longnames, (2) setting memberof (which we shouldn't have to do anymore; we can just traverse children), (3) getting the module a class or interface is defined in so we can link to it, and (4) one other things, so it's worth setting them.
             index[id] = node
+            if parents is not None:
+                parents[id] = parent
 
         # Burrow into everything that could contain more ID'd items. We don't
         # need setSignature or getSignature for now. Do we need indexSignature?
-        for tag in ['children', 'signatures', 'parameters']:
-            for child in node.get(tag, []):
-                index_by_id(index, child, parent=node)
+        # Go in reverse so nodes are visited in document order.
+        for tag in ['parameters', 'signatures', 'children']:
+            children = node.get(tag)
+            if children:
+                todo.extend((child, node) for child in reversed(children))
+    return index
+
+
+#: Kinds of nodes that become IR objects. External modules aren't among them;
+#: we shouldn't need them until we implement automodule. Nor are TS's old
+#: internal Modules. Does anybody even use those anymore?
+CONVERTED_KINDS = {'Interface', 'Class', 'Property', 'Variable', 'Accessor',
+                   'Call signature', 'Constructor signature'}
+
+
+def convertible_node(node):
+    """Return the node a TypeDoc node's IR object is made from, or None if it
+    doesn't become one, and the nodes within it that might.
+
+    Functions, constructors, and methods are made from their first signature.
+
+    """
+    if is_foreign(node):
+        return None, []
+
+    kind = node.get('kindString')
+    if kind in ['Function', 'Constructor', 'Method']:
+        # There's really nothing in these; all the interesting bits are in
+        # the contained 'Call signature' keys. We support only the first
+        # signature at the moment, because to do otherwise would create
+        # multiple identical pathnames to the same function, which would
+        # cause the suffix tree to raise an exception while being built. An
+        # eventual solution might be to store the signatures in a one-to-
+        # many attr of Functions.
+        # The signature's sources are its parent's, which we've just checked.
+        sigs = node.get('signatures')
+        return convertible_node(sigs[0])  # Should always have at least one
+    return (node if kind in CONVERTED_KINDS else None), node.get('children', [])
+
+
+def is_foreign(node):
+    """Return whether a node is one we never document: one inherited from
+    elsewhere or from an absolute path, like /usr/lib."""
+    if node.get('inheritedFrom'):
+        return True
+    sources = node.get('sources')
+    return bool(sources) and sources[0].get('fileName', '.')[0] == '/'
+
+
+def without_foreign_nodes(root):
+    """Return a TypeDoc node with the foreign nodes taken out of its children
+    and theirs, and a list of (foreign node, parent) pairs.
+
+    The nodes are left alone. Those with children are copied instead.
 
-        return index
+    """
+    foreign = []
+    root = dict(root)
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        kept = []
+        for child in node.get('children', []):
+            if is_foreign(child):
+                foreign.append((child, node))
+                continue
+            if child.get('children'):
+                child = dict(child)
+                todo.append(child)
+            kept.append(child)
+        if 'children' in node:
+            node['children'] = kept
+    return root, foreign
+
+
+#: Keys of TypeDoc nodes under which there are never any types
+TYPELESS_KEYS = {'comment', 'flags', 'groups', 'sources'}
+
+
+def referenced_ids(root):
+    """Return the set of IDs of the nodes referred to by types anywhere within
+    a TypeDoc node."""
+    ids = set()
+    todo = [root]
+    # This touches every value in the JSON, so it's tuned a bit.
+    pop, push = todo.pop, todo.append
+    while todo:
+        value = pop()
+        if type(value) is dict:
+            if value.get('type') == 'reference' and 'id' in value:
+                ids.add(value['id'])
+            for key, v in value.items():
+                if type(v) in (dict, list) and key not in TYPELESS_KEYS:
+                    push(v)
+        else:
+            for v in value:
+                if type(v) in (dict, list):
+                    push(v)
+    return ids
+
+
+def convertible_nodes(root):
+    """Return an iterable of the nodes under a TypeDoc node, inclusive, that
+    become IR objects."""
+    todo = [root]
+    while todo:
+        node, more_todo = convertible_node(todo.pop())
+        if node is not None:
+            yield node
+        todo.extend(more_todo)
 
 
 def make_description(comment):
@@ -414,9 +755,7 @@ def short_name(node):
     return node['name']
 
 
-# Optimization: Could memoize this for probably a decent perf gain: every child
-# of an object redoes the work for all its parents.
-def make_path_segments(node, base_dir, child_was_static=None):
+def make_path_segments(node, base_dir, parents):
     """Return the full, unambiguous list of path segments that points to an
     entity described by a TypeDoc JSON node.
 
@@ -424,10 +763,12 @@ def make_path_segments(node, base_dir, child_was_static=None):
 
     :arg base_dir: Absolute path of the dir relative to which file-path
         segments are constructed
-    :arg child_was_static: True if the child node we're computing the path of
-        is a static member of the node under consideration. False if it is.
-        None if the current node is the one we're ultimately computing the path
-        of.
+    :arg parents: The mapping of node IDs to parent nodes made by
+        ``index_by_id()``
+
+    This walks up through the parents. To get the paths of many nodes, use
+    ``path_contexts()``, which works from the top down, computing each node's
+    path once.
 
     TypeDoc uses a totally different, locality-sensitive resolution mechanism
     for links: https://typedoc.org/guides/link-resolution/. It seems like a
@@ -438,33 +779,34 @@ def make_path_segments(node, base_dir, child_was_static=None):
     namepath-like paths, even if we eventually support {@link} syntax.
 
     """
-    node_is_static = node.get('flags', {}).get('isStatic', False)
-
-    parent = node.get('__parent')
-    parent_segments = (make_path_segments(parent, base_dir, child_was_static=node_is_static)
-                       if parent else [])
-
+    lineage = []
+    while node:
+        lineage.append(node)
+        node = parents.get(node.get('id'))
+    context, parent = PathContext(), None
+    for node in reversed(lineage):
+        context, parent = context.child(node, parent, base_dir), node
+    return context.path()
+
+
+def own_segments(node, parent, base_dir):
+    """Return the path segments a TypeDoc node adds to those of the nodes
+    above it, with no delimiter after the last, or [] if it adds none."""
     kind = node.get('kindString')
-    delimiter = '' if child_was_static is None else '.'
-
     # Handle the cases here that are handled in _convert_node(), plus any that
     # are encountered on other nodes on the way up to the root.
-    if kind in ['Variable', 'Property', 'Accessor', 'Interface', 'Module']:
+    if kind in ['Variable', 'Property', 'Accessor', 'Interface', 'Module', 'Class']:
         # We emit a segment for a Method's child Call Signature but skip the
         # Method itself. They 2 nodes have the same names, but, by taking the
         # child, we fortuitously end up without a trailing delimiter on our
         # last segment.
-        segments = [node['name']]
+        return [node['name']]
     elif kind in ['Call signature', 'Constructor signature']:
         # Similar to above, we skip the parent Constructor and glom onto the
         # Constructor Signature. That gets us no trailing delimiter. However,
         # the signature has name == 'new Foo', so we go up to the parent to get
         # the real name, which is usually (always?) "constructor".
-        segments = [parent['name']]
-    elif kind == 'Class':
-        segments = [node['name']]
-        if child_was_static is False:
-            delimiter = '#'
+        return [parent['name']]
     elif kind == 'External module':
         # 'name' contains folder names if multiple folders are passed into
         # TypeDoc. It's also got excess quotes. So we ignore it and take
@@ -474,16 +816,88 @@ def make_path_segments(node, base_dir, child_was_static=None):
             rel = f'.{sep}{rel}'
         segments = rel.split(sep)
         filename = splitext(segments[-1])[0]
-        segments = [s + '/' for s in segments[:-1]] + [filename]
+        return [s + '/' for s in segments[:-1]] + [filename]
     else:
         # None, as for a root node, Constructor, or Method
-        segments = []
+        return []
 
-    if segments:
-        # It's not some abstract thing the user doesn't think about and we skip
-        # over.
-        segments[-1] += delimiter
-        return parent_segments + segments
-    else:
-        # Allow some levels of the JSON to not have a corresponding path segment:
-        return parent_segments
+
+class PathContext:
+    """The path of a TypeDoc node and the module containing it, worked out
+    from those of its parent so each is computed once per node"""
+
+    __slots__ = ('segments', 'is_class', 'static', 'module')
+
+    def __init__(self, segments=(), is_class=False, static=None, module=None):
+        #: The path segments of the nearest node, inclusive, that has any, with
+        #: no delimiter after the last
+        self.segments = segments
+        #: Whether that node is a class, whose instance members are delimited
+        #: by "#" rather than "."
+        self.is_class = is_class
+        #: If this node has no segments of its own, whether the node beneath
+        #: that nearest one is static, which decides the delimiter for
+        #: everything within. Otherwise, None; each child decides.
+        self.static = static
+        #: A tuple of the Pathname and deppath (None if it has no
+        #: ``originalName``) of the nearest External module above the node, or
+        #: None if there isn't one
+        self.module = module
+
+    def child(self, node, parent, base_dir):
+        """Return the context of a node, given that this is its parent's.
+
+        :arg parent: The parent node, or None if ``node`` is the root
+
+        """
+        is_static = node.get('flags', {}).get('isStatic', False)
+        module = self.module
+        if parent is not None and parent.get('kindString') == 'External module':
+            deppath = parent.get('originalName')
+            module = (Pathname(self.segments),
+                      relpath(deppath, base_dir) if deppath else None)
+        own = own_segments(node, parent, base_dir)
+        if not own:
+            # Allow some levels of the JSON to not have a corresponding path
+            # segment:
+            return PathContext(self.segments,
+                               self.is_class,
+                               is_static if self.static is None else self.static,
+                               module)
+        return PathContext(self.path(is_static) + own,
+                           node.get('kindString') == 'Class',
+                           None,
+                           module)
+
+    def path(self, child_is_static=None):
+        """Return the path segments of the node, delimited as they would be
+        before those of a child.
+
+        :arg child_is_static: Whether that child is static, or None for no
+            child: just the node's own path.
+
+        """
+        if not self.segments:
+            return []
+        static = child_is_static if self.static is None else self.static
+        if static is None:
+            return list(self.segments)
+        delimiter = '#' if self.is_class and static is False else '.'
+        return self.segments[:-1] + [self.segments[-1] + delimiter]
+
+
+def path_contexts(root, base_dir, parent=None, parent_context=None):
+    """Return an iterable of (node, PathContext) pairs for a TypeDoc node and
+    every node within its children and signatures, top-down.
+
+    :arg parent: The parent of ``root``, if it has one
+    :arg parent_context: The PathContext of that parent
+
+    """
+    todo = [(root, parent, parent_context or PathContext())]
+    while todo:
+        node, parent, parent_context = todo.pop()
+        context = parent_context.child(node, parent, base_dir)
+        yield node, context
+        for tag in ['children', 'signatures']:
+            todo.extend((child, node, context) for child in node.get(tag, []))
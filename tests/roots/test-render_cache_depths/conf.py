@@ -0,0 +1,10 @@
+extensions = [
+    'sphinx_js'
+]
+
+# Minimal stuff needed for Sphinx to work:
+source_suffix = '.rst'
+master_doc = 'index'
+author = 'Erik Rose'
+exclude_patterns = ['_build', 'Thumbs.db', '.DS_Store']
+js_source_path = '.'
@@ -0,0 +1,150 @@
+from io import StringIO
+from json import dumps
+from os import utime
+import pickle
+
+import pytest
+
+from sphinx_js.analyzer_utils import (cache_to_file, IrCache, iter_json_array,
+                                      snapshotted, source_manifest)
+from sphinx_js.suffix_tree import SuffixTree
+
+
+def test_cache_invalidation(tmp_path):
+    """The cache should be reused until a source file or setting changes."""
+    source = tmp_path / 'a.js'
+    source.write_text('one')
+    sources = [str(source)]
+    settings = {'version': 1}
+    calls = []
+
+    @cache_to_file(lambda cache: cache,
+                   lambda cache: (sources, settings))
+    def analyze(cache):
+        calls.append(source.read_text())
+        return [len(calls)]
+
+    cache = str(tmp_path / 'cache.json')
+    assert analyze(cache) == [1]
+    assert analyze(cache) == [1]
+
+    source.write_text('two')
+    assert analyze(cache) == [2]
+    assert calls == ['one', 'two']
+
+    # Adding a source file flushes the cache:
+    other = tmp_path / 'b.js'
+    other.write_text('three')
+    sources.append(str(other))
+    assert analyze(cache) == [3]
+
+    settings['version'] = 2
+    assert analyze(cache) == [4]
+    assert analyze(cache) == [4]
+
+
+def test_snapshot(tmp_path):
+    """Analyzers should be restored from snapshots until their inputs change,
+    and then be updated in place if possible."""
+    source = tmp_path / 'a.js'
+    source.write_text('one')
+    inputs = ([str(source)], {'version': 1})
+    snapshot = str(tmp_path / 'analysis.pickle')
+    builds = []
+    updates = []
+
+    def build():
+        builds.append(source.read_text())
+        tree = SuffixTree()
+        tree.add(['a.', source.read_text()], len(builds))
+        return tree
+
+    def update(tree, stale, manifest):
+        updates.append(stale)
+        return None if 'rebuild' in source.read_text() else tree
+
+    assert snapshotted(snapshot, inputs, build, update).get(['one']) == 1
+    restored = snapshotted(snapshot, inputs, build, update)
+    assert restored.get(['one']) == 1
+    assert builds == ['one']
+
+    source.write_text('two')
+    assert snapshotted(snapshot, inputs, build, update).get(['one']) == 1
+    assert updates == [{str(source)}]
+    source.write_text('rebuild')
+    assert snapshotted(snapshot, inputs, build, update).get(['rebuild']) == 2
+
+    # Changing a setting means starting over:
+    assert snapshotted(snapshot, ([str(source)], {'version': 2}), build).get(['rebuild']) == 3
+    assert len(updates) == 2
+
+
+def test_manifest_reuses_hashes(tmp_path):
+    """Files whose mtime and size haven't changed shouldn't be rehashed."""
+    source = tmp_path / 'a.js'
+    source.write_text('one')
+    filename = str(source)
+    # Pretend it was written long enough ago that its mtime can be trusted:
+    utime(filename, ns=(10 ** 9, 10 ** 9))
+    manifest = source_manifest([filename])
+    mtime, size, digest = manifest[filename]
+    assert mtime == 10 ** 9
+
+    doctored = {filename: [mtime, size, 'made-up hash']}
+    assert source_manifest([filename], previous=doctored)[filename][2] == 'made-up hash'
+
+    # Recently modified files are always rehashed:
+    utime(filename)
+    assert source_manifest([filename])[filename][0] is None
+    doctored = {filename: [None, size, 'made-up hash']}
+    assert source_manifest([filename], previous=doctored)[filename][2] == digest
+
+    # Missing files are left out:
+    assert source_manifest([str(tmp_path / 'missing.js')]) == {}
+
+
+def test_iter_json_array():
+    """Items should come out whole no matter where chunk boundaries fall."""
+    items = [{'comment': '/** Hi. */', 'meta': {'lineno': i}} for i in range(20)] + [12345, 'a string', [], {}]
+    text = dumps(items, indent=2)
+    for chunk_size in [1, 2, 7, 100, 1 << 16]:
+        assert list(iter_json_array(StringIO(text), chunk_size)) == items
+    assert list(iter_json_array(StringIO(' [ ] '), 1)) == []
+    for invalid in ['', 'There are no input files to process.', '{}', '[1,', '[1 2]', '[1,]', '[1]x']:
+        with pytest.raises(ValueError):
+            list(iter_json_array(StringIO(invalid), 1))
+
+
+def test_ir_cache():
+    """The IR cache should keep the most recently used objects, count hits and
+    misses, and, if weak, find evicted objects still referred to elsewhere."""
+    class Obj:
+        pass
+
+    made = []
+
+    def make():
+        made.append(Obj())
+        return made[-1]
+
+    cache = IrCache(maxsize=2)
+    a = cache.get('a', make)
+    assert cache.get('a', make) is a
+    cache.get('b', make)
+    cache.get('c', make)  # Evicts a
+    assert cache.get('a', make) is not a
+    assert (cache.hits, cache.misses, len(cache)) == (1, 4, 2)
+
+    cache = IrCache(maxsize=1, weak=True)
+    a = cache.get('a', make)
+    cache.get('b', make)  # Keeps a only weakly
+    assert cache.get('a', make) is a
+    del a
+    made.clear()
+    cache.get('b', make)
+    cache.get('a', make)  # Nothing kept the old a alive.
+    assert len(made) == 2
+
+    # Only the settings survive pickling:
+    cache = pickle.loads(pickle.dumps(cache))
+    assert (cache.maxsize, cache.weak, len(cache), cache.hits) == (1, True, 0, 0)
@@ -1,5 +1,6 @@
 """Test incremental builds."""
 
+from dataclasses import replace
 import warnings
 
 import pytest
@@ -7,6 +8,9 @@ from sphinx.environment import CONFIG_NEW, CONFIG_OK
 from sphinx.testing.path import path
 from sphinx.testing.util import strip_escseq
 
+import sphinx_js
+from tests.testing import FixedAnalyzer, objects
+
 
 def build(app):
     """Build the given app, collecting docnames read and written (resolved).
@@ -88,3 +92,54 @@ def test_incremental_ts(make_app, app_params):
 
     app = make_app(*args, freshenv=True, **kwargs)
     do_test(app, extension='ts')
+
+
+@pytest.mark.sphinx('html', testroot='incremental_js',
+                    confoverrides={'js_object_dependencies': True})
+def test_incremental_js_objects(make_app, app_params):
+    """With js_object_dependencies, only the pages documenting something
+    that changed should be reread."""
+    args, kwargs = app_params
+    app = make_app(*args, freshenv=True, **kwargs)
+    build(app)
+
+    # Shifting everything down a line changes nothing documented:
+    a_js = path(app.srcdir) / 'a.js'
+    a_js.write_text('\n' + a_js.read_text())
+    status, reads, writes = build(app)
+    assert reads == []
+
+    # ClassA has methodA as a member, so both pages depend on it:
+    a_js.write_text(a_js.read_text().replace('Here.', 'There.'))
+    status, reads, writes = build(app)
+    assert reads == ['a', 'a_b']
+
+
+@pytest.mark.sphinx('html', testroot='renderer_backends',
+                    confoverrides={'js_object_dependencies': True})
+def test_object_fingerprints(make_app, app_params, monkeypatch):
+    """Pages should be reread when what they render changes, but not when
+    only line numbers do."""
+    def analyze(app):
+        app._sphinxjs_analyzer = FixedAnalyzer(objects(), app.confdir)
+    monkeypatch.setattr(sphinx_js, 'analyze', analyze)
+
+    args, kwargs = app_params
+    app = make_app(*args, freshenv=True, **kwargs)
+    status, reads, writes = build(app)
+    assert reads == ['attributes', 'classes', 'functions', 'index']
+
+    current = objects()
+
+    def reanalyze(change):
+        current[:] = [change(obj) for obj in current]
+        app._sphinxjs_analyzer = FixedAnalyzer(current, app.confdir)
+        return build(app)[1]
+
+    assert reanalyze(lambda obj: replace(obj, line=obj.line + 10)) == []
+    # A changed member of a class:
+    assert reanalyze(lambda obj: (replace(obj, members=[replace(m, description='New.')
+                                                        for m in obj.members])
+                                  if obj.name == 'Thing' else obj)) == ['classes']
+    assert reanalyze(lambda obj: (replace(obj, type='number')
+                                  if obj.name == 'lonely' else obj)) == ['attributes']
@@ -1,8 +1,31 @@
+from os.path import basename, dirname, join, splitext
+from random import Random
+
+from parsimonious.exceptions import ParseError
+import pytest
+
 from sphinx_js.ir import Attribute, Exc, Function, Param, Pathname, Return
-from sphinx_js.jsdoc import full_path_segments
+from sphinx_js import jsdoc
+from sphinx_js.jsdoc import (Analyzer, balanced_shards, file_links, full_path_segments,
+                             jsdoc_source_files, merge_shard_outputs, source_file)
+from sphinx_js.parsers import path_and_formal_params, PathVisitor
+from sphinx_js.suffix_tree import SuffixNotFound
 from tests.testing import JsDocTestCase
 
 
+def doclet(file, longname, **kwargs):
+    """Return a documented doclet from a file, by default under /src, with
+    boring defaults for anything not given."""
+    file = join('/src', str(file))
+    fields = dict(comment='/** Hi. */',
+                  meta={'path': dirname(file), 'filename': basename(file), 'lineno': 1, 'code': {}},
+                  name=longname.split('#')[-1],
+                  longname=longname,
+                  kind='function')
+    fields.update(kwargs)
+    return fields
+
+
 def test_doclet_full_path():
     """Sanity-check full_path_segments(), including throwing it a non-.js filename."""
     doclet = {
@@ -22,6 +45,255 @@ def test_doclet_full_path():
     ]
 
 
+def test_doclet_full_path_matches_grammar():
+    """Make sure the piecewise, memoized scanning in full_path_segments()
+    agrees with parsing the whole path with the grammar."""
+    def reference(doclet, base_dir):
+        meta = doclet['meta']
+        path = '%s/%s.%s' % (meta['path'].replace('/base', '.', 1),
+                             splitext(meta['filename'])[0],
+                             doclet['longname'])
+        try:
+            return PathVisitor().visit(path_and_formal_params['path'].parse(path))
+        except ParseError as exc:
+            return type(exc)
+
+    def actual(doclet, base_dir):
+        try:
+            return full_path_segments(doclet, base_dir)
+        except ParseError as exc:
+            return type(exc)
+
+    dirs = ['/base', '/base/dir', '/base/d\\', '/base/.hidden', '/base/a.b/c']
+    filenames = ['file.js', 'f\\.js', 'a.b.js', '.js']
+    pieces = ['a', 'b', '.', '#', '~', '/', '\\', '(', 'x']
+    random = Random(42)
+    for _ in range(2000):
+        doclet = {'meta': {'path': random.choice(dirs),
+                           'filename': random.choice(filenames)},
+                  'longname': ''.join(random.choice(pieces)
+                                      for _ in range(random.randint(0, 6)))}
+        assert actual(doclet, '/base') == reference(doclet, '/base'), doclet
+
+
+def test_jsdoc_source_files(tmp_path):
+    """Make sure we predict the same set of files jsdoc will read."""
+    for name in ['a.js', 'b.jsx', 'c.ts', '_private.js', 'sub/d.js', 'sub/sub/e.js', 'skip/f.js',
+                 'skipped.js', 'sub/x.js']:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text('')
+    root = str(tmp_path)
+
+    def relative(files):
+        return [f[len(root) + 1:] for f in files]
+
+    assert relative(jsdoc_source_files([root], root, {})) == ['a.js', 'b.jsx', 'skipped.js']
+    assert relative(jsdoc_source_files([root], root, {
+        'opts': {'recurse': True},
+        'recurseDepth': 2,
+        'source': {'includePattern': '\\.(js|ts)$',
+                   # A sibling whose name merely starts the same is kept:
+                   'exclude': ['skip', 'sub/x.js']}})) == ['a.js', 'c.ts', 'skipped.js', 'sub/d.js']
+    assert relative(jsdoc_source_files([join(root, 'a.js')], root, {
+        'source': {'include': ['sub/d.js']}})) == ['a.js', 'sub/d.js']
+
+
+def test_splice():
+    """Swapping in fresh doclets for a changed file should update every
+    index, leaving other files' doclets alone."""
+    analyzer = Analyzer([doclet('a.js', 'A'),
+                         doclet('a.js', 'A#old', memberof='A'),
+                         doclet('b.js', 'B'),
+                         doclet('b.js', 'B#method', memberof='B')],
+                        '/src')
+    analyzer.splice([doclet('a.js', 'A'),
+                     doclet('a.js', 'A#new', memberof='A'),
+                     # Output for unchanged files is ignored:
+                     doclet('b.js', 'B#interloper', memberof='B')],
+                    ['/src/a.js'])
+    assert [m.name for m in analyzer.get_object(['A'], 'class').members] == ['new']
+    assert [m.name for m in analyzer.get_object(['B'], 'class').members] == ['method']
+    with pytest.raises(SuffixNotFound):
+        analyzer.get_object(['old'], 'function')
+
+    # Deleted files take their doclets with them:
+    analyzer.splice([], ['/src/b.js'])
+    with pytest.raises(SuffixNotFound):
+        analyzer.get_object(['B'], 'class')
+    assert [d['longname'] for d in analyzer.doclets()] == ['A', 'A#new']
+
+
+def test_rerun_linked_files(tmp_path, monkeypatch):
+    """Files related to changed ones by @augments, @mixes, or @borrows should
+    be rerun with them, so copied members stay current."""
+    def fake_jsdoc(cache, files, *args):
+        """Emit the doclets jsdoc would, copying inherited members in only
+        when the base class is in the same run."""
+        ran.append(sorted(basename(f) for f in files))
+        output = [d for d in after if source_file(d) in files]
+        if str(base) in files and str(child) in files:
+            output.append(doclet(tmp_path / 'base.js', 'Child#' + method, memberof='Child', inherited=True))
+        return output
+
+    base, child, other = (tmp_path / name for name in ['base.js', 'child.js', 'other.js'])
+    for file in [base, child, other]:
+        file.write_text('')
+    analyzer = Analyzer([doclet(tmp_path / 'base.js', 'Base'),
+                         doclet(tmp_path / 'base.js', 'Base#old', memberof='Base'),
+                         doclet(tmp_path / 'child.js', 'Child', augments=['Base']),
+                         doclet(tmp_path / 'base.js', 'Child#old', memberof='Child', inherited=True),
+                         doclet(tmp_path / 'other.js', 'Other')],
+                        str(tmp_path))
+    method = 'new'
+    after = [doclet(tmp_path / 'base.js', 'Base'),
+             doclet(tmp_path / 'base.js', 'Base#new', memberof='Base'),
+             doclet(tmp_path / 'child.js', 'Child', augments=['Base']),
+             doclet(tmp_path / 'other.js', 'Other')]
+    ran = []
+    monkeypatch.setattr(jsdoc, 'jsdoc_output', fake_jsdoc)
+    manifest = {str(f): None for f in [base, child, other]}
+    analyzer._rerun([str(base)], manifest, str(tmp_path), None, 1)
+    assert ran == [['base.js', 'child.js']]
+    assert sorted(d['longname'] for d in analyzer.doclets()) == [
+        'Base', 'Base#new', 'Child', 'Child#new', 'Other']
+
+    # A file that newly borrows from an unchanged one brings it along:
+    other.write_text('/** @borrows Base#new as new */')
+    ran.clear()
+    analyzer._rerun([str(other)], manifest, str(tmp_path), None, 1)
+    assert ran == [['base.js', 'child.js', 'other.js']]
+
+
+def test_rerun_new_and_removed_links(tmp_path, monkeypatch):
+    """A changed file newly augmenting a class in an unchanged one should be
+    rerun with it, and the dependents of a removed file should be rerun."""
+    def fake_jsdoc(cache, files, *args):
+        """Emit the doclets of the given files, with the members of any
+        superclass also among them copied into its subclasses."""
+        ran.append(sorted(basename(f) for f in files))
+        output = [d for d in sources if source_file(d) in files]
+        for sub in output[:]:
+            for d in output[:]:
+                if d.get('memberof') in sub.get('augments', []):
+                    output.append(dict(d, longname=sub['longname'] + '#' + d['name'],
+                                       memberof=sub['longname'], inherited=True))
+        return output
+
+    base, child, old, sub = (str(tmp_path / name) for name in ['base.js', 'child.js', 'old.js', 'sub.js'])
+    for file in [base, child, old, sub]:
+        open(file, 'w').close()
+    sources = [doclet(base, 'Base'),
+               doclet(base, 'Base#m', memberof='Base'),
+               doclet(child, 'Child'),
+               doclet(old, 'Old'),
+               doclet(old, 'Old#x', memberof='Old'),
+               doclet(sub, 'Sub', augments=['Old'])]
+    ran = []
+    monkeypatch.setattr(jsdoc, 'jsdoc_output', fake_jsdoc)
+    analyzer = Analyzer(fake_jsdoc(None, [base, child, old, sub]), str(tmp_path))
+    manifest = {f: None for f in [base, child, old, sub]}
+
+    sources[2] = doclet(child, 'Child', augments=['Base'])
+    ran.clear()
+    analyzer._rerun([child], manifest, str(tmp_path), None, 1)
+    assert ran == [['child.js'], ['base.js', 'child.js']]
+    assert 'Child#m' in [d['longname'] for d in analyzer.doclets()]
+
+    del manifest[old]
+    sources = [d for d in sources if source_file(d) != old]
+    ran.clear()
+    analyzer._rerun([old], manifest, str(tmp_path), None, 1)
+    assert ran == [['sub.js']]
+    assert sorted(d['longname'] for d in analyzer.doclets()) == [
+        'Base', 'Base#m', 'Child', 'Child#m', 'Sub']
+
+
+def test_file_links():
+    """Files should be linked to those defining what their doclets augment,
+    mix in, borrow, or belong to, but not to themselves."""
+    assert file_links([doclet('a.js', 'A'),
+                       doclet('a.js', 'A#m', memberof='A'),
+                       doclet('b.js', 'B', augments=['A'], mixes=['M', 'Unknown']),
+                       doclet('b.js', 'B#m', memberof='B', inherited=True),
+                       doclet('c.js', 'M'),
+                       doclet('d.js', 'D', borrowed=[{'from': 'A#m', 'as': 'm'}]),
+                       {'kind': 'package', 'longname': 'package:undefined'}]) == {
+        ('/src/b.js', '/src/a.js'),
+        ('/src/b.js', '/src/c.js'),
+        ('/src/d.js', '/src/a.js')}
+
+
+def test_ir_memoized():
+    """Converted IR objects should be reused, including as class members,
+    until doclets are spliced in."""
+    analyzer = Analyzer([doclet('a.js', 'A'), doclet('a.js', 'A#method', memberof='A')], '/src')
+    method = analyzer.get_object(['method'], 'function')
+    cls = analyzer.get_object(['A'], 'class')
+    assert cls.members == [method] and cls.members[0] is method
+    assert analyzer.get_object(['A'], 'class') is cls
+    assert (analyzer.ir_cache.hits, analyzer.ir_cache.misses) == (2, 2)
+
+    analyzer.splice([doclet('a.js', 'A'), doclet('a.js', 'A#method', memberof='A')], ['/src/a.js'])
+    assert analyzer.get_object(['A'], 'class') is not cls
+
+
+def test_balanced_shards(tmp_path):
+    """Shards should come out about equally heavy, and no file should be lost
+    or duplicated."""
+    files = []
+    for name, size in [('a', 90), ('b', 50), ('c', 40), ('d', 30), ('e', 20)]:
+        file = tmp_path / (name + '.js')
+        file.write_text('x' * size)
+        files.append(str(file))
+    shards = balanced_shards(files, 2)
+    assert sorted(f for shard in shards for f in shard) == files
+    assert sorted(sum(len(open(f).read()) for f in shard) for shard in shards) == [110, 120]
+    assert len(balanced_shards(files[:1], 4)) == 1
+
+
+def test_merge_shard_outputs():
+    """Merged output should look like that of a single jsdoc run."""
+    files = ['/src/a.js', '/src/b.js', '/src/c.js']
+    merged = merge_shard_outputs(
+        files,
+        [['/src/b.js'], ['/src/a.js', '/src/c.js']],
+        [[doclet('b.js', 'b'),
+          # Brought along by a source.include config option:
+          doclet('c.js', 'c'),
+          {'kind': 'package', 'longname': 'package:undefined', 'files': ['/src/b.js', '/src/c.js']}],
+         [doclet('a.js', 'a'),
+          doclet('c.js', 'c'),
+          {'kind': 'package', 'longname': 'package:undefined', 'files': ['/src/a.js', '/src/c.js']}]])
+    assert [d['longname'] for d in merged] == ['a', 'b', 'c', 'package:undefined']
+    assert merged[-1]['files'] == files
+
+
+def test_linked_shards_run_together(tmp_path, monkeypatch):
+    """Shards holding files related by @augments, @mixes, or @borrows should
+    be rerun together, so members jsdoc copies across them aren't lost."""
+    def fake_jsdoc(files, *args):
+        ran.append([basename(f) for f in files])
+        output = [d for d in doclets if source_file(d) in files]
+        if str(tmp_path / 'a.js') in files and str(tmp_path / 'c.js') in files:
+            output.append(doclet(tmp_path / 'a.js', 'C#m', memberof='C', inherited=True))
+        return output
+
+    for name, size in [('a', 40), ('b', 30), ('c', 20), ('d', 10)]:
+        (tmp_path / (name + '.js')).write_text('x' * size)
+    (tmp_path / 'd.js').write_text('/** @borrows B#m as m */')
+    doclets = [doclet(tmp_path / 'a.js', 'A'),
+               doclet(tmp_path / 'a.js', 'A#m', memberof='A'),
+               doclet(tmp_path / 'b.js', 'B'),
+               doclet(tmp_path / 'b.js', 'B#m', memberof='B'),
+               doclet(tmp_path / 'c.js', 'C', augments=['A']),
+               doclet(tmp_path / 'd.js', 'D')]
+    ran = []
+    monkeypatch.setattr(jsdoc, '_run_jsdoc', fake_jsdoc)
+    merged = jsdoc.jsdoc_output(None, [str(tmp_path)], str(tmp_path), str(tmp_path), jobs=4)
+    assert sorted(ran) == [['a.js'], ['a.js', 'c.js'], ['b.js'], ['b.js', 'd.js'], ['c.js'], ['d.js']]
+    assert [d['longname'] for d in merged] == ['A', 'A#m', 'C#m', 'B', 'B#m', 'C', 'D']
+
+
 class FunctionTests(JsDocTestCase):
     file = 'function.js'
 
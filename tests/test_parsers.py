@@ -1,4 +1,9 @@
-from sphinx_js.parsers import PathVisitor, path_and_formal_params
+from random import Random
+
+from parsimonious.exceptions import IncompleteParseError, ParseError
+
+from sphinx_js.parsers import (PathVisitor, parse_path, parse_path_and_formal_params,
+                               path_and_formal_params)
 
 
 def test_escapes():
@@ -16,3 +21,54 @@ def test_relative_dirs():
         path_and_formal_params['path'].parse('./hi')) == ['./', 'hi']
     assert PathVisitor().visit(
         path_and_formal_params['path'].parse('../../hi')) == ['../', '../', 'hi']
+
+
+def test_parse_path_matches_grammar():
+    """Make sure the hand-rolled path scanner agrees with the grammar on
+    everything, including what it refuses."""
+    def grammar_result(text):
+        try:
+            return PathVisitor().visit(path_and_formal_params['path'].parse(text))
+        except IncompleteParseError:
+            return IncompleteParseError
+        except ParseError:
+            return ParseError
+
+    def scanner_result(text):
+        try:
+            return parse_path(text)
+        except IncompleteParseError:
+            return IncompleteParseError
+        except ParseError:
+            return ParseError
+
+    pieces = ['a', 'bc', '.', '/', '#', '~', '\\', '(', ')', ' ', '\n', '\xe9',
+              './', '../']
+    random = Random(42)
+    for _ in range(5000):
+        text = ''.join(random.choice(pieces)
+                       for _ in range(random.randint(0, 10)))
+        assert scanner_result(text) == grammar_result(text), repr(text)
+
+
+def test_parse_path_and_formal_params_matches_grammar():
+    """Make sure the cached directive-argument parser agrees with the
+    grammar, and that callers can't corrupt its cache."""
+    def result(parse, text):
+        try:
+            return parse(text)
+        except IncompleteParseError:
+            return IncompleteParseError
+        except ParseError:
+            return ParseError
+
+    pieces = ['a', '.', '#', '\\', '(', ')', ', ', '=', '\n', './']
+    random = Random(42)
+    for _ in range(3000):
+        text = ''.join(random.choice(pieces)
+                       for _ in range(random.randint(0, 8)))
+        assert (result(parse_path_and_formal_params, text) ==
+                result(PathVisitor().parse, text)), repr(text)
+
+    parse_path_and_formal_params('foo.bar(a)')[0].append('oops')
+    assert parse_path_and_formal_params('foo.bar(a)') == [['foo.', 'bar'], '(a)']
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from sphinx_js.ir import Pathname
+from sphinx_js.render_cache import (load_render_caches, RenderCache, render_key,
+                                    save_render_caches)
+
+
+def test_eviction():
+    """The least recently used renderings should go first once the budget is
+    exceeded."""
+    cache = RenderCache(budget=10)
+    cache.put('a', 'aaaa')
+    cache.put('b', 'bbbb')
+    assert cache.get('a') == 'aaaa'  # Makes b the least recently used
+    cache.put('c', 'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
+    assert cache.get('c') == 'cccc'
+
+    # Replacing an entry shouldn't count it twice:
+    cache.put('c', 'cc')
+    cache.put('d', 'dddd')
+    assert len(cache) == 3
+
+    # Something bigger than the whole budget doesn't stick around:
+    cache.put('e', 'e' * 11)
+    assert len(cache) == 0
+
+
+def test_render_key():
+    """Keys should depend on the content of the IR, not its identity."""
+    assert render_key('x', Pathname(['a.', 'b'])) == render_key('x', Pathname(['a.', 'b']))
+    assert render_key('x', Pathname(['a.', 'b'])) != render_key('x', Pathname(['a.', 'c']))
+
+
+def test_explicit_sizes():
+    """Values which aren't strings should count against the budget by the
+    size they're given."""
+    cache = RenderCache(budget=10)
+    cache.put('a', ['node'], 6)
+    cache.put('b', ['node'], 6)
+    assert cache.get('a') is None
+    assert cache.get('b') == ['node']
+
+
+def test_set_valued_config(tmp_path):
+    """A nodes cache should survive to the next build under config holding
+    equal sets, even ones whose reprs come out in a different order."""
+    class Config(list):
+        js_render_cache_size = js_node_cache_size = 100
+
+    def app(value):
+        config = Config([SimpleNamespace(name='js_things', value=value, rebuild='env')])
+        app = SimpleNamespace(config=config, doctreedir=str(tmp_path))
+        load_render_caches(app)
+        return app
+
+    first, second = {'kinds': [{1, 9}]}, {'kinds': [{9, 1}]}
+    assert first == second and repr(first) != repr(second)
+    saved = app(first)
+    saved._sphinxjs_caches['nodes'].put('key', ['node'], 1)
+    save_render_caches(saved, None)
+    assert app(second)._sphinxjs_caches['nodes'].get('key') == ['node']
@@ -0,0 +1,77 @@
+"""Test that building doctrees straight from the IR makes the same ones as
+rendering RST with the templates and parsing it."""
+
+import warnings
+
+import pytest
+
+import sphinx_js
+from tests.testing import FixedAnalyzer, objects
+
+
+def build(app, renderer):
+    """Build all docs with one renderer, and return their doctrees, the JS
+    objects described, and the warnings."""
+    app.config.js_renderer = renderer
+    app._warning.seek(0)
+    app._warning.truncate()
+    with warnings.catch_warnings():
+        warnings.filterwarnings(action='ignore', category=DeprecationWarning)
+        app.build(force_all=True)
+    return ([app.env.get_doctree(docname).pformat()
+             for docname in ['functions', 'classes', 'attributes']],
+            dict(app.env.get_domain('js').objects),
+            app._warning.getvalue())
+
+
+@pytest.mark.sphinx('dummy', testroot='renderer_backends')
+def test_renderers_match(make_app, app_params, monkeypatch):
+    """Building nodes directly should give the same doctrees, objects, and
+    warnings as the templates."""
+    def analyze(app):
+        app._sphinxjs_analyzer = FixedAnalyzer(objects(), app.confdir)
+    monkeypatch.setattr(sphinx_js, 'analyze', analyze)
+
+    args, kwargs = app_params
+    app = make_app(*args, freshenv=True, **kwargs)
+    # Keep the caches from hiding what the templates make:
+    app._sphinxjs_caches = {}
+    assert build(app, 'nodes') == build(app, 'templates')
+
+
+@pytest.mark.sphinx('dummy', testroot='renderer_backends')
+def test_changed_default_rerendered(make_app, app_params, monkeypatch):
+    """Changing nothing but a param's default should change what's rendered,
+    rather than bring back a cached rendering."""
+    fixed = objects()
+    greet = fixed[0]
+
+    def analyze(app):
+        app._sphinxjs_analyzer = FixedAnalyzer(fixed, app.confdir)
+    monkeypatch.setattr(sphinx_js, 'analyze', analyze)
+
+    # The second app reads everything again but loads the render caches the
+    # first one saved:
+    args, kwargs = app_params
+    before = build(make_app(*args, freshenv=True, **kwargs), 'templates')[0][0]
+    greet.params[1].default = '{loud: true}'
+    after = build(make_app(*args, freshenv=True, **kwargs), 'templates')[0][0]
+    assert after != before
+    assert 'opts={loud: true}' in after
+
+
+@pytest.mark.sphinx('html', testroot='render_cache_depths')
+def test_cached_nodes_link_from_their_own_page(make_app, app_params, monkeypatch):
+    """Nodes reused from the cache on a page at another depth should link
+    relative to that page, not the one that first parsed them."""
+    def analyze(app):
+        app._sphinxjs_analyzer = FixedAnalyzer(objects(), app.confdir)
+    monkeypatch.setattr(sphinx_js, 'analyze', analyze)
+
+    args, kwargs = app_params
+    app = make_app(*args, freshenv=True, **kwargs)
+    with warnings.catch_warnings():
+        warnings.filterwarnings(action='ignore', category=DeprecationWarning)
+        app.build()
+    html = (app.outdir / 'sub' / 'deep.html').read_text()
+    assert 'href="../index.html#Thing"' in html
@@ -0,0 +1,60 @@
+from json import loads
+import os
+from shutil import which
+
+import pytest
+
+from sphinx_js.analyzer_utils import Command
+from sphinx_js.sidecar import run_in_sidecar, SidecarUnavailable
+
+
+pytestmark = pytest.mark.skipif(not which('node') or os.name == 'nt',
+                                reason='The sidecar needs node and Unix sockets.')
+
+
+@pytest.fixture
+def tool(tmp_path, monkeypatch):
+    """Install a node script called "faketool" on the PATH, and return the
+    address of a sidecar to run it in, which quits afterward."""
+    package = tmp_path / 'node_modules' / 'faketool'
+    package.mkdir(parents=True)
+    (package / 'package.json').write_text('{"name": "faketool"}')
+    script = package / 'cli.js'
+    script.write_text('#!/usr/bin/env node\n'
+                      'console.error("to stderr");\n'
+                      'process.stdout.write(JSON.stringify({args: process.argv.slice(2),\n'
+                      '                                     cwd: process.cwd(),\n'
+                      '                                     env: process.env.FAKETOOL}));\n')
+    bin = tmp_path / 'bin'
+    bin.mkdir()
+    (bin / 'faketool').symlink_to(script)
+    (bin / 'notnode').write_text('#!/bin/sh\necho hi\n')
+    for name in ['faketool', 'notnode']:
+        (bin / name).chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin) + os.pathsep + os.environ['PATH'])
+    address = str(tmp_path / 'sidecar.sock')
+    yield address
+    # The sidecar quits once its socket is gone.
+    if os.path.exists(address):
+        os.remove(address)
+
+
+def test_run(tool, tmp_path, monkeypatch, capfd):
+    """Commands should see their own arguments, directory, and environment,
+    and the helper should be reused."""
+    command = Command('faketool')
+    command.add('-X', 'a b')
+    for value in ['one', 'two']:
+        monkeypatch.setenv('FAKETOOL', value)
+        output = run_in_sidecar(tool, command, str(tmp_path), lambda stdout: loads(stdout.read()))
+        assert output == {'args': ['-X', 'a b'], 'cwd': str(tmp_path), 'env': value}
+    assert capfd.readouterr().err == 'to stderr\n' * 2
+
+
+def test_unavailable(tool):
+    """Programs which aren't node scripts should be left to run the ordinary
+    way."""
+    with pytest.raises(SidecarUnavailable):
+        run_in_sidecar(tool, Command('notnode'))
+    with pytest.raises(SidecarUnavailable):
+        run_in_sidecar(tool, Command('nonexistent'))
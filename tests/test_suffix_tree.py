@@ -1,6 +1,11 @@
+from itertools import product
+from pickle import dumps, loads
+from random import Random
+
 from pytest import raises
 
-from sphinx_js.suffix_tree import SuffixAmbiguous, SuffixNotFound, SuffixTree
+from sphinx_js.suffix_tree import (PathsTaken, PathTaken, SuffixAmbiguous,
+                                   SuffixNotFound, SuffixTree)
 
 
 def test_things():
@@ -67,3 +72,165 @@ def test_value_ambiguity():
     except SuffixAmbiguous as exc:
         assert exc.next_possible_keys == ['b']
         assert exc.or_ends_here
+
+
+def test_remove():
+    """Removing a path should prune it without disturbing its neighbors."""
+    s = SuffixTree()
+    s.add(['./', 'dir/', 'utils.', 'max'], 1)
+    s.add(['./', 'dir/', 'footils.', 'max'], 2)
+    s.remove(['./', 'dir/', 'utils.', 'max'])
+    assert s.get_with_path(['max']) == (2, ['./', 'dir/', 'footils.', 'max'])
+    with raises(SuffixNotFound):
+        s.get(['utils.', 'max'])
+    with raises(SuffixNotFound):
+        s.remove(['./', 'dir/', 'utils.', 'max'])
+    with raises(SuffixNotFound):
+        s.remove(['footils.', 'max'])  # Not a full path
+    s.remove(['./', 'dir/', 'footils.', 'max'])
+    with raises(SuffixNotFound):
+        s.get(['max'])
+
+
+class DictSuffixTree:
+    """The original, uncompressed suffix tree, kept as a reference for the
+    behavior of the real one"""
+    def __init__(self):
+        self._tree = {}
+
+    def add(self, segments, value):
+        tree = self._tree
+        for seg in reversed(segments):
+            tree = tree.setdefault('subtree', {}).setdefault(seg, {})
+        if 'value' in tree:
+            raise PathTaken(segments)
+        tree['value'] = value
+
+    def remove(self, segments):
+        tree = self._tree
+        ancestry = []
+        for seg in reversed(segments):
+            try:
+                child = tree['subtree'][seg]
+            except KeyError:
+                raise SuffixNotFound(segments)
+            ancestry.append((tree, seg))
+            tree = child
+        if 'value' not in tree:
+            raise SuffixNotFound(segments)
+        del tree['value']
+        for parent, seg in reversed(ancestry):
+            if tree:
+                break
+            del parent['subtree'][seg]
+            if not parent['subtree']:
+                del parent['subtree']
+            tree = parent
+
+    def get_with_path(self, segments):
+        tree = self._tree
+        for seg in reversed(segments):
+            try:
+                tree = tree['subtree'][seg]
+            except KeyError:
+                raise SuffixNotFound(segments)
+        if 'value' in tree:
+            if 'subtree' in tree:
+                raise SuffixAmbiguous(segments, list(tree['subtree'].keys()), or_ends_here=True)
+            return tree['value'], segments
+        additional_segments = []
+        while len(tree.get('subtree', {})) == 1:
+            only_key = next(iter(tree['subtree'].keys()))
+            tree = tree['subtree'][only_key]
+            additional_segments.append(only_key)
+        if len(tree.get('subtree', {})) > 1:
+            raise SuffixAmbiguous(segments, list(tree['subtree'].keys()))
+        return tree['value'], (list(reversed(additional_segments)) + segments)
+
+
+def outcome(tree, segments):
+    """Return what looking up some segments does, in a comparable form."""
+    try:
+        return tree.get_with_path(segments)
+    except SuffixAmbiguous as exc:
+        return 'ambiguous', exc.next_possible_keys, exc.or_ends_here
+    except (SuffixNotFound, KeyError):
+        # The reference implementation raises KeyError when the tree is
+        # empty.
+        return 'not found'
+
+
+def test_matches_reference():
+    """Make sure the compressed tree behaves exactly like the plain one,
+    whatever is added to and removed from it, and after pickling."""
+    alphabet = ['a', 'b', 'c']
+    queries = [list(p) for length in range(5) for p in product(alphabet, repeat=length)]
+    random = Random(42)
+    for _ in range(200):
+        paths = [[random.choice(alphabet) for _ in range(random.randint(0, 4))]
+                 for _ in range(random.randint(1, 12))]
+        reference = DictSuffixTree()
+        conflicts = []
+        for value, path in enumerate(paths):
+            try:
+                reference.add(path, value)
+            except PathTaken as exc:
+                conflicts.append(exc.segments)
+
+        tree = SuffixTree()
+        try:
+            tree.add_many((path, value) for value, path in enumerate(paths))
+        except PathsTaken as exc:
+            assert exc.conflicts == conflicts
+        else:
+            assert not conflicts
+        trees = [tree, loads(dumps(tree))]
+
+        for path in random.sample(paths, len(paths) // 2) + [['b', 'a']]:
+            try:
+                reference.remove(path)
+            except SuffixNotFound:
+                for tree in trees:
+                    with raises(SuffixNotFound):
+                        tree.remove(path)
+            else:
+                for tree in trees:
+                    tree.remove(path)
+            for query in queries:
+                expected = outcome(reference, query)
+                for tree in trees:
+                    assert outcome(tree, query) == expected, (paths, query)
+
+
+def test_index_matches_tree():
+    """Make sure lookups through the index, bounded or not, give exactly
+    what walking the tree does."""
+    alphabet = ['a', 'b', 'c']
+    queries = [list(p) for length in range(6) for p in product(alphabet, repeat=length)]
+    random = Random(42)
+    for _ in range(100):
+        tree = SuffixTree()
+        for value in range(random.randint(0, 12)):
+            try:
+                tree.add([random.choice(alphabet) for _ in range(random.randint(0, 4))], value)
+            except PathTaken:
+                pass
+        expected = [outcome(tree, query) for query in queries]
+        for max_suffix_length in [None, 2]:
+            tree.build_index(max_suffix_length)
+            assert [outcome(tree, query) for query in queries] == expected
+
+
+def test_index_invalidation():
+    """Adding or removing items should throw away the index."""
+    s = SuffixTree()
+    s.add(['a', 'b'], 1)
+    count, size = s.build_index()
+    assert count == 3  # (), ('b',), and ('a', 'b')
+    assert size > 0
+    s.add(['c', 'b'], 2)
+    with raises(SuffixAmbiguous):
+        s.get(['b'])
+    s.build_index()
+    s.remove(['a', 'b'])
+    assert s.get_with_path(['b']) == (2, ['c', 'b'])
@@ -1,11 +1,14 @@
+from copy import deepcopy
 from json import loads
-from os.path import dirname
+from os.path import dirname, relpath, sep, splitext
 from unittest import TestCase
 
 import pytest
 
+from sphinx_js.analyzer_utils import is_explicitly_rooted
 from sphinx_js.ir import Attribute, Class, Function, Param, Pathname, Return
-from sphinx_js.typedoc import index_by_id, make_path_segments
+from sphinx_js.typedoc import (Analyzer as TsAnalyzer, index_by_id, make_path_segments,
+                               merge_typedoc_outputs, path_contexts, without_foreign_nodes)
 from tests.testing import dict_where, NO_MATCH, TypeDocAnalyzerTestCase, TypeDocTestCase
 
 
@@ -77,18 +80,228 @@ class IndexByIdTests(TestCase):
             }
           ]
         }""")
-        index = index_by_id({}, json)
+        original = deepcopy(json)
+        parents = {}
+        index = index_by_id({}, json, parents)
         # Things get indexed by ID:
         function = index[2]
         assert function['name'] == 'foo'
         # Things get parent links:
-        assert function['__parent']['name'] == '"longnames"'
-        assert function['__parent']['__parent']['name'] == 'misterRoot'
+        assert parents[2]['name'] == '"longnames"'
+        assert parents[1]['name'] == 'misterRoot'
         # Root gets indexed by ID:
         root = index[0]
         assert root['name'] == 'misterRoot'
-        # Root parent link is absent or None:
-        assert root.get('__parent') is None
+        # Root parent link is None:
+        assert parents[0] is None
+        # The JSON is left alone:
+        assert json == original
+
+
+def bottom_up_path_segments(node, base_dir, parents, child_was_static=None):
+    """The original way of working out a node's path, by walking up through
+    its parents, kept as a reference for ``path_contexts()``"""
+    node_is_static = node.get('flags', {}).get('isStatic', False)
+    parent = parents.get(node.get('id'))
+    parent_segments = (bottom_up_path_segments(parent, base_dir, parents, child_was_static=node_is_static)
+                       if parent else [])
+    kind = node.get('kindString')
+    delimiter = '' if child_was_static is None else '.'
+    if kind in ['Variable', 'Property', 'Accessor', 'Interface', 'Module']:
+        segments = [node['name']]
+    elif kind in ['Call signature', 'Constructor signature']:
+        segments = [parent['name']]
+    elif kind == 'Class':
+        segments = [node['name']]
+        if child_was_static is False:
+            delimiter = '#'
+    elif kind == 'External module':
+        rel = relpath(node['originalName'], base_dir)
+        if not is_explicitly_rooted(rel):
+            rel = f'.{sep}{rel}'
+        segments = rel.split(sep)
+        filename = splitext(segments[-1])[0]
+        segments = [s + '/' for s in segments[:-1]] + [filename]
+    else:
+        segments = []
+    if segments:
+        segments[-1] += delimiter
+        return parent_segments + segments
+    return parent_segments
+
+
+class PathContextsTests(TestCase):
+    """Make sure paths and containing modules worked out from the top down
+    match the ones worked out from the bottom up, by the original
+    algorithm."""
+
+    def test_contexts(self):
+        def method(id, name, is_static):
+            return {'id': id,
+                    'name': name,
+                    'kindString': 'Method',
+                    'flags': {'isStatic': is_static},
+                    'signatures': [{'id': id + 1,
+                                    'name': name,
+                                    'kindString': 'Call signature',
+                                    'flags': {}}]}
+
+        json = {
+            'id': 0,
+            'name': 'misterRoot',
+            'children': [{
+                'id': 1,
+                'name': '"dir/things"',
+                'kindString': 'External module',
+                'originalName': '/a/b/dir/things.ts',
+                'children': [{
+                    'id': 2,
+                    'name': 'Thing',
+                    'kindString': 'Class',
+                    'children': [method(3, 'instanceMethod', False),
+                                 method(5, 'staticMethod', True),
+                                 {'id': 7,
+                                  'name': 'prop',
+                                  'kindString': 'Property',
+                                  'flags': {}}]
+                }, {
+                    'id': 8,
+                    'name': 'Space',
+                    'kindString': 'Module',
+                    'children': [{'id': 9,
+                                  'name': 'spaced',
+                                  'kindString': 'Variable'}]
+                }]
+            }]
+        }
+        contexts = {node['id']: context
+                    for node, context in path_contexts(json, '/a/b')}
+        parents = {}
+        index = index_by_id({}, json, parents)
+        for id, path in [(4, ['./', 'dir/', 'things.', 'Thing#', 'instanceMethod']),
+                         (6, ['./', 'dir/', 'things.', 'Thing.', 'staticMethod']),
+                         (7, ['./', 'dir/', 'things.', 'Thing#', 'prop']),
+                         (9, ['./', 'dir/', 'things.', 'Space.', 'spaced'])]:
+            assert bottom_up_path_segments(index[id], '/a/b', parents) == path
+            assert contexts[id].path() == path
+            assert make_path_segments(index[id], '/a/b', parents) == path
+            assert contexts[id].module == (Pathname(['./', 'dir/', 'things']), 'dir/things.ts')
+        assert contexts[1].module is None
+        for id, context in contexts.items():
+            assert context.path() == bottom_up_path_segments(index[id], '/a/b', parents)
+
+
+class ForeignNodeTests(TestCase):
+    """Make sure nodes we never document are left out of the indices but
+    can still be referred to."""
+
+    def json(self):
+        def source(filename):
+            return [{'fileName': filename, 'line': 1}]
+
+        return {
+            'id': 0,
+            'name': 'misterRoot',
+            'children': [{
+                'id': 1,
+                'name': '"lib"',
+                'kindString': 'External module',
+                'originalName': '/usr/lib/lib.d.ts',
+                'sources': source('/usr/lib/lib.d.ts'),
+                'children': [{'id': 2,
+                              'name': 'Element',
+                              'kindString': 'Interface',
+                              'sources': source('/usr/lib/lib.d.ts')},
+                             {'id': 3,
+                              'name': 'Unused',
+                              'kindString': 'Interface',
+                              'sources': source('/usr/lib/lib.d.ts')}]
+            }, {
+                'id': 4,
+                'name': '"things"',
+                'kindString': 'External module',
+                'originalName': '/a/b/things.ts',
+                'sources': source('things.ts'),
+                'children': [{
+                    'id': 5,
+                    'name': 'Thing',
+                    'kindString': 'Class',
+                    'sources': source('things.ts'),
+                    'extendedTypes': [{'type': 'reference', 'id': 2, 'name': 'Element'}],
+                    'children': [{'id': 6,
+                                  'name': 'element',
+                                  'kindString': 'Property',
+                                  'sources': source('things.ts'),
+                                  'type': {'type': 'reference', 'id': 2, 'name': 'Element'}},
+                                 {'id': 7,
+                                  'name': 'inherited',
+                                  'kindString': 'Property',
+                                  'sources': source('things.ts'),
+                                  'inheritedFrom': {'type': 'reference', 'id': -1, 'name': 'x'},
+                                  'type': {'type': 'intrinsic', 'name': 'number'}}]
+                }]
+            }]
+        }
+
+    def test_left_out(self):
+        json = self.json()
+        original = deepcopy(json)
+        pruned, foreign = without_foreign_nodes(json)
+        assert [node['id'] for node, _ in foreign] == [1, 7]
+        assert list(index_by_id({}, pruned)) == [0, 4, 5, 6]
+        # The JSON is left alone:
+        assert json == original
+
+    def test_references(self):
+        analyzer = TsAnalyzer(self.json(), '/a/b', lazy=True)
+        thing = analyzer.get_object(['Thing'])
+        assert thing.supers == [Pathname(['../', '../', 'usr/', 'lib/', 'lib.d.', 'Element'])]
+        assert [member.type for member in thing.members] == ['Element']
+        # Only the referenced foreign node is indexed:
+        assert 2 in analyzer._index and 3 not in analyzer._index
+
+
+def test_merge_typedoc_outputs():
+    """Make sure the outputs of separate TypeDoc runs are renumbered into one
+    tree, with a module seen by both runs kept once and referred to by its
+    kept IDs."""
+    def module(id, filename, children):
+        return {'id': id,
+                'name': '"%s"' % filename,
+                'kindString': 'External module',
+                'originalName': '/a/%s.ts' % filename,
+                'children': children}
+
+    def interface(id, name):
+        return {'id': id, 'name': name, 'kindString': 'Interface'}
+
+    def group(*children):
+        return [{'title': 'External modules', 'kind': 1, 'children': list(children)}]
+
+    shared = module(1, 'shared', [interface(2, 'Shape')])
+    first = {'id': 0, 'name': 'root', 'children': [shared], 'groups': group(1)}
+    second = {
+        'id': 0,
+        'name': 'root',
+        'children': [
+            module(1, 'things', [{
+                'id': 2,
+                'name': 'Thing',
+                'kindString': 'Class',
+                'implementedTypes': [{'type': 'reference', 'id': 4, 'name': 'Shape'}],
+                'groups': [{'title': 'Classes', 'kind': 128, 'children': [2]}]}]),
+            module(3, 'shared', [interface(4, 'Shape')])],
+        'groups': group(1, 3)}
+    merged = merge_typedoc_outputs([first, second])
+    assert ([child['originalName'] for child in merged['children']] ==
+            ['/a/shared.ts', '/a/things.ts'])
+    things = merged['children'][1]
+    thing = things['children'][0]
+    assert (things['id'], thing['id']) == (3, 4)
+    # The reference points at the first run's Shape:
+    assert thing['implementedTypes'][0]['id'] == 2
+    assert thing['groups'][0]['children'] == [4]
+    assert merged['groups'] == group(1, 3)
 
 
 class PathSegmentsTests(TypeDocTestCase):
@@ -105,7 +318,7 @@ class PathSegmentsTests(TypeDocTestCase):
         obj = self.commented_object(comment, **kwargs)
         if obj is NO_MATCH:
             raise RuntimeError(f'No object found with the comment "{comment}".')
-        return make_path_segments(obj, self._source_dir)
+        return make_path_segments(obj, self._source_dir, self.parents)
 
     def test_class(self):
         assert self.commented_object_path('Foo class') == ['./', 'pathSegments.', 'Foo']
@@ -154,7 +367,7 @@ class PathSegmentsTests(TypeDocTestCase):
         """Make sure FS path segments are emitted if ``base_dir`` doesn't
         directly contain the code."""
         obj = self.commented_object('Function')
-        segments = make_path_segments(obj, dirname(dirname(self._source_dir)))
+        segments = make_path_segments(obj, dirname(dirname(self._source_dir)), self.parents)
         assert segments == ['./', 'test_typedoc_analysis/', 'source/', 'pathSegments.', 'foo']
 
     def test_namespaced_var(self):
@@ -294,6 +507,53 @@ class ConvertNodeTests(TypeDocAnalyzerTestCase):
         assert setter.type == 'string'
 
 
+class LazyConversionTests(TypeDocAnalyzerTestCase):
+    """Make sure converting nodes as they're asked for makes the same IR as
+    converting them all up front."""
+
+    files = ['nodes.ts']
+
+    def test_same_objects(self):
+        lazy = TsAnalyzer(self.json, self._source_dir, lazy=True)
+        for path in [['Superclass'],
+                     ['EmptySubclass'],
+                     ['Interface'],
+                     ['InterfaceWithMembers'],
+                     ['func'],
+                     ['ClassWithProperties'],
+                     ['ClassWithProperties.', 'someStatic'],
+                     ['ClassWithProperties#', 'someOptional'],
+                     ['gettable'],
+                     ['settable']]:
+            assert lazy.get_object(path) == self.analyzer.get_object(path)
+
+    def test_memoized(self):
+        """Make sure members are converted once, whether asked for through
+        their class or on their own."""
+        lazy = TsAnalyzer(self.json, self._source_dir, lazy=True)
+        cls = lazy.get_object(['ClassWithProperties'])
+        static = lazy.get_object(['ClassWithProperties.', 'someStatic'])
+        assert any(member is static for member in cls.members)
+        assert lazy.get_object(['ClassWithProperties']) is cls
+
+
+class TypeNameMemoTests(TestCase):
+    def test_shared(self):
+        """Make sure equal types get the very same description string."""
+        analyzer = TsAnalyzer({'id': 0, 'name': 'misterRoot'}, '/', lazy=True)
+
+        def union():
+            return {'type': 'union',
+                    'types': [{'type': 'intrinsic', 'name': ''.join(['str', 'ing'])},
+                              {'type': 'stringLiteral', 'value': 'a'}]}
+
+        name = analyzer._type_name(union())
+        assert name == 'string|"a"'
+        assert analyzer._type_name(union()) is name
+        assert (analyzer._type_name({'type': 'intrinsic', 'name': ''.join(['num', 'ber'])}) is
+                analyzer._type_name({'type': 'intrinsic', 'name': ''.join(['numb', 'er'])}))
+
+
 class TypeNameTests(TypeDocAnalyzerTestCase):
     """Make sure our rendering of TypeScript types into text works."""
 
@@ -6,7 +6,10 @@ import sys
 
 from sphinx.cmd.build import main as sphinx_main
 
+from sphinx_js.ir import (Attribute, Class, Exc, Function, Interface, Param,
+                          Pathname, Return)
 from sphinx_js.jsdoc import Analyzer as JsAnalyzer, jsdoc_output
+from sphinx_js.suffix_tree import SuffixTree
 from sphinx_js.typedoc import Analyzer as TsAnalyzer, index_by_id, typedoc_output
 
 
@@ -72,11 +75,13 @@ class TypeDocTestCase(ThisDirTestCase):
     def setup_class(cls):
         """Run the TS analyzer over the TypeDoc output."""
         cls._source_dir = join(cls.this_dir(), 'source')
-        cls.json = typedoc_output([join(cls._source_dir, file)
+        cls.json = typedoc_output(None,
+                                  [join(cls._source_dir, file)
                                    for file in cls.files],
                                   cls._source_dir,
                                   'tsconfig.json')
-        index_by_id({}, cls.json)
+        cls.parents = {}
+        index_by_id({}, cls.json, cls.parents)
 
 
 class TypeDocAnalyzerTestCase(TypeDocTestCase):
@@ -134,3 +139,140 @@ def dict_where(json, already_seen=None, **kwargs):
         # We don't know how to match leaf values yet.
         pass
     return NO_MATCH
+
+
+def _member_fields(name, segments, defaults, overrides):
+    """Return the fields of a member-ish IR object, with boring defaults for
+    anything not given."""
+    fields = dict(name=name,
+                  path=Pathname(segments),
+                  filename='lib.js',
+                  deppath=None,
+                  description='',
+                  line=1,
+                  deprecated=False,
+                  examples=[],
+                  see_alsos=[],
+                  properties=[],
+                  exported_from=None,
+                  is_abstract=False,
+                  is_optional=False,
+                  is_static=False,
+                  is_private=False,
+                  **defaults)
+    fields.update(overrides)
+    return fields
+
+
+def function(name, segments, **kwargs):
+    """Return a Function with boring defaults for anything not given."""
+    return Function(**_member_fields(name, segments, dict(params=[], exceptions=[], returns=[]), kwargs))
+
+
+def attribute(name, segments, **kwargs):
+    """Return an Attribute with boring defaults for anything not given."""
+    return Attribute(**_member_fields(name, segments, dict(type=None), kwargs))
+
+
+def objects():
+    """Return IR objects exercising everything the templates can show."""
+    method = function(
+        'frob',
+        ['./', 'lib.', 'Thing#', 'frob'],
+        description='Frob the thing.',
+        params=[Param('times', 'How many *times*', type='number')],
+        returns=[Return('boolean', 'Whether it worked')])
+    return [
+        function(
+            'greet',
+            ['./', 'lib.', 'greet'],
+            description='Say **hello**.\n\nIt has a second paragraph.',
+            deprecated='Use :js:func:`lib.bump` instead.',
+            examples=['greet("you")', '  if (x) {\n    greet()\n  }\n'],
+            see_alsos=['Thing', 'lib.bump'],
+            params=[Param('whom', 'Who to greet, wrapped\nover two lines', type='string'),
+                    Param('opts', has_default=True, default='{}', type='Object'),
+                    Param('opts.loud', 'Whether to *shout*', type='boolean'),
+                    Param('rest', 'Leftovers', is_variadic=True),
+                    Param('nothing')],
+            exceptions=[Exc('TypeError', 'If **whom** is missing'), Exc(None, 'Sometimes')],
+            returns=[Return('string', 'The greeting'), Return(None, '')]),
+        function('bump',
+                 ['./', 'lib.', 'bump'],
+                 is_static=True,
+                 is_optional=True,
+                 deprecated=True),
+        function('later', ['./', 'lib.', 'later'], returns=[Return('Promise.<string>', '')]),
+        Class(name='Thing',
+              path=Pathname(['./', 'lib.', 'Thing']),
+              filename='lib.js',
+              deppath=None,
+              description='A thing.',
+              line=3,
+              deprecated='Things are over.',
+              examples=['new Thing()'],
+              see_alsos=['greet'],
+              properties=[],
+              exported_from=Pathname(['./', 'lib']),
+              is_abstract=True,
+              interfaces=[Pathname(['./', 'lib.', 'Shape'])],
+              supers=[Pathname(['./', 'lib.', 'Base']), Pathname(['./', 'lib.', 'Other'])],
+              constructor=function(
+                  'Thing',
+                  ['./', 'lib.', 'Thing'],
+                  description='Make a thing.',
+                  params=[Param('size', 'How big', type='number')]),
+              members=[method,
+                       attribute('colour', ['./', 'lib.', 'Thing#', 'colour'], type='string'),
+                       attribute('secret', ['./', 'lib.', 'Thing#', 'secret'], is_private=True),
+                       attribute('skipped', ['./', 'lib.', 'Thing#', 'skipped'])]),
+        Interface(name='Shape',
+                  path=Pathname(['./', 'lib.', 'Shape']),
+                  filename='lib.js',
+                  deppath=None,
+                  description='Something with sides.',
+                  line=9,
+                  deprecated=False,
+                  examples=[],
+                  see_alsos=[],
+                  properties=[],
+                  exported_from=None,
+                  members=[],
+                  supers=[]),
+        Class(name='Empty',
+              path=Pathname(['./', 'lib.', 'Empty']),
+              filename='lib.js',
+              deppath=None,
+              description='',
+              line=12,
+              deprecated=False,
+              examples=[],
+              see_alsos=[],
+              properties=[],
+              exported_from=None,
+              is_abstract=False,
+              interfaces=[],
+              supers=[],
+              constructor=None,
+              members=[]),
+        attribute('colour',
+                  ['./', 'lib.', 'colour'],
+                  type='``Colour`` or *string*',
+                  description='What colour it is.',
+                  deprecated=True,
+                  examples=['colour = "red"'],
+                  see_alsos=['Thing'],
+                  is_optional=True),
+        attribute('lonely', ['./', 'lib.', 'lonely'])]
+
+
+class FixedAnalyzer:
+    """An analyzer of some hand-made IR objects"""
+
+    def __init__(self, objects, base_dir):
+        self._base_dir = base_dir
+        self._objects_by_path = SuffixTree()
+        self._objects_by_path.add_many((obj.path.segments, obj) for obj in objects)
+
+    def get_object(self, path_suffix, as_type):
+        return self._objects_by_path.get(path_suffix)